@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CrudConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crud'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .database import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='crud.configure_sqlite')
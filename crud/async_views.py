@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import authenticate, login
+from django.contrib.auth.views import redirect_to_login
+from django.db import close_old_connections
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+from . import gender_jobs, throttling, views
+from .directory import acached_directory_json
+from .genders import gender_registry
+from .routers import replica_reads
+
+# hashlib releases the GIL while it runs PBKDF2, so a few dedicated threads
+# check passwords in parallel without tying up the threads that serve the
+# sync parts of other requests.
+auth_executor = ThreadPoolExecutor(max_workers=settings.CRUD_AUTH_THREADS, thread_name_prefix='crud-auth')
+
+
+def check_credentials(request, username, password):
+    try:
+        return authenticate(request, username=username, password=password)
+    finally:
+        # Pool threads outlive the request, so give their connection back the
+        # way request_finished does for request threads.
+        close_old_connections()
+
+
+def async_login_required(view_func):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        # request.user loads the session and the user row on first access.
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path(), 'login')
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def async_condition(etag_func, vary=()):
+    # The 4.2 condition, cache_control and vary_on_headers decorators only
+    # wrap sync views, this is the same stack for coroutines.
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view_func(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            patch_cache_control(response, private=True, no_cache=True)
+            if vary:
+                patch_vary_headers(response, vary)
+            return response
+        return wrapper
+    return decorator
+
+
+async def user_login(request):
+    if request.method == 'POST':
+        form_type = request.POST.get('form_type')
+        if form_type == 'login':
+            username = request.POST.get('username')
+            password = request.POST.get('password')
+            wait = await sync_to_async(throttling.retry_after)('login', request, username)
+            if wait:
+                return await sync_to_async(views.too_many_attempts)(request, wait)
+            await sync_to_async(throttling.record)('login', request, username, scopes=[throttling.IP])
+            loop = asyncio.get_running_loop()
+            user = await loop.run_in_executor(auth_executor, partial(check_credentials, request, username, password))
+            if user is not None:
+                await sync_to_async(login)(request, user)
+                return redirect('user_list')
+            else:
+                await sync_to_async(throttling.record)('login', request, username, scopes=[throttling.USERNAME])
+                login_url = reverse('login')
+                redirect_url = f"{login_url}?error=1"
+                return HttpResponseRedirect(redirect_url)
+        elif form_type == 'forgot_password':
+            return await sync_to_async(views.forgot_password)(request)
+    return await sync_to_async(render)(request, 'login.html')
+
+
+@async_login_required
+@async_condition(views.user_list_etag, vary=('X-Requested-With',))
+@replica_reads
+async def user_list(request):
+    search_query = request.GET.get('search', '')
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        try:
+            content = await acached_directory_json(request.GET)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+        return HttpResponse(content, content_type='application/json')
+
+    return await sync_to_async(views.render_user_list)(request, search_query)
+
+
+@async_login_required
+@async_condition(views.gender_list_etag)
+@replica_reads
+async def gender_list(request):
+    genders = await gender_registry.aall()
+    jobs = await sync_to_async(gender_jobs.recent_jobs)()
+    return await sync_to_async(render)(request, 'gender_list.html', {'genders': genders, 'jobs': jobs})
@@ -0,0 +1,131 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from crud.directory import encode_cursor
+
+from .fixtures import BENCH_PASSWORD, BENCH_USERNAME, client_address
+from .stats import summarize
+
+SEARCH_TERMS = ('', 'Last1', 'First2', 'user3', 'example')
+
+XHR = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+def directory_params(count, max_user_id, seed=0):
+    # Random cursors and searches, so most fetches miss the page cache and
+    # reach the database.
+    rng = random.Random(seed)
+    params = []
+    for _ in range(count):
+        item = {'mode': 'cursor', 'search': rng.choice(SEARCH_TERMS)}
+        after = rng.randint(0, max_user_id)
+        if after:
+            item['after'] = encode_cursor(after)
+        params.append(item)
+    return params
+
+
+def login_data():
+    return {'form_type': 'login', 'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}
+
+
+def check(response, status):
+    if response.status_code != status:
+        raise AssertionError(f"Expected a {status} response, got {response.status_code}.")
+
+
+def session_cookie():
+    client = Client()
+    client.force_login(User.objects.get(username=BENCH_USERNAME))
+    return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+
+def run_wsgi(requests, concurrency, session_key):
+    # Threaded WSGI worker: every request holds a thread from start to end.
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = Client()
+            local.client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        return local.client
+
+    def timed(request):
+        kind, payload = request
+        start = time.perf_counter()
+        if kind == 'directory':
+            check(client().get(reverse('user_list'), payload, headers=XHR), 200)
+        else:
+            data, address = payload
+            check(Client(REMOTE_ADDR=address).post(reverse('login'), data), 302)
+        elapsed = time.perf_counter() - start
+        close_old_connections()
+        return kind, elapsed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(timed, requests))
+    return results, time.perf_counter() - start
+
+
+def run_asgi(requests, concurrency, session_key):
+    # One event loop, each request in its own ThreadSensitiveContext as
+    # ASGIHandler does, so sync sections of different requests do not queue
+    # behind a single thread.
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(request):
+            kind, payload = request
+            async with semaphore:
+                async with ThreadSensitiveContext():
+                    start = time.perf_counter()
+                    if kind == 'directory':
+                        client = AsyncClient()
+                        client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+                        check(await client.get(reverse('user_list'), payload, headers=XHR), 200)
+                    else:
+                        data, address = payload
+                        check(await AsyncClient(client=[address, 0]).post(reverse('login'), data), 302)
+                    elapsed = time.perf_counter() - start
+                    await sync_to_async(close_old_connections)()
+            return kind, elapsed
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(timed(request) for request in requests))
+        return results, time.perf_counter() - start
+
+    return asyncio.run(main())
+
+
+def run(mode, directory_requests=400, logins=20, concurrency=32):
+    # Three scenarios: directory fetches alone, logins alone, and both
+    # interleaved to show whether password checks starve the directory.
+    max_user_id = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    directory = [('directory', params) for params in directory_params(directory_requests, max_user_id)]
+    sign_ins = [('login', (login_data(), client_address(n))) for n in range(logins)]
+    mixed = directory[:]
+    for index, request in enumerate(sign_ins):
+        mixed.insert(index * len(directory) // max(1, len(sign_ins)), request)
+
+    session_key = session_cookie()
+    runner = run_asgi if mode == 'asgi' else run_wsgi
+    report = {}
+    for scenario, requests in (('directory', directory), ('login', sign_ins), ('mixed', mixed)):
+        if not requests:
+            continue
+        results, elapsed = runner(requests, concurrency, session_key)
+        report[scenario] = summarize([elapsed for _, elapsed in results], elapsed)
+        if scenario == 'mixed':
+            report['mixed_directory'] = summarize([elapsed for kind, elapsed in results if kind == 'directory'])
+    return report
@@ -0,0 +1,76 @@
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.test import Client
+from django.urls import reverse
+
+from crud.directory import encode_cursor
+
+from .fixtures import BENCH_USERNAME
+from .stats import summarize
+
+
+def worker(session_key, stop, task, samples, errors):
+    client = Client()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    rng = random.Random(threading.get_ident())
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            response = task(client, rng)
+            ok = response.status_code in (200, 302)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        if ok:
+            samples.append(elapsed)
+        else:
+            errors.append(elapsed)
+        # What request_finished does after every real request: drop the
+        # connection, unless CONN_MAX_AGE keeps it.
+        close_old_connections()
+
+
+def run(readers=8, writers=2, duration=5.0):
+    # Readers page through the directory with random cursors while writers
+    # keep saving user_edit forms, each write moving the directory version.
+    admin = User.objects.get(username=BENCH_USERNAME)
+    client = Client()
+    client.force_login(admin)
+    session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+    user_ids = list(User.objects.exclude(pk=admin.pk).values_list('id', flat=True))
+    max_id = max(user_ids)
+
+    def read(client, rng):
+        params = {'mode': 'cursor', 'after': encode_cursor(rng.randint(1, max_id))}
+        return client.get(reverse('user_list'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def write(client, rng):
+        user_id = rng.choice(user_ids)
+        return client.post(reverse('user_edit', args=[user_id]), {
+            'username': f'user{user_id}',
+            'first_name': f'First{user_id}',
+            'last_name': f'Edited{rng.randint(0, 999)}',
+            'email': f'user{user_id}@example.com',
+            'address': f'{rng.randint(1, 999)} Edited Street',
+            'phone_number': '5550199',
+        })
+
+    stop = threading.Event()
+    reads, read_errors, writes, write_errors = [], [], [], []
+    threads = [threading.Thread(target=worker, args=(session_key, stop, read, reads, read_errors)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=(session_key, stop, write, writes, write_errors)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        'reads': dict(summarize(reads, duration), errors=len(read_errors)),
+        'writes': dict(summarize(writes, duration), errors=len(write_errors)),
+    }
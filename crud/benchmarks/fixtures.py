@@ -0,0 +1,86 @@
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from crud import caching, search, stats
+from crud.genders import gender_registry
+from crud.models import Gender, Profile
+from crud.routers import REPLICA_ALIAS
+
+GENDER_NAMES = ('Female', 'Male', 'Non-binary', 'Other')
+
+BENCH_USERNAME = 'bench'
+BENCH_PASSWORD = 'bench-password'
+
+
+def client_address(n):
+    # A distinct client IP per simulated visitor, so benchmarks of many
+    # sign-ins are not held back by the per-IP login throttle.
+    return '10.%d.%d.%d' % ((n >> 16) & 255, (n >> 8) & 255, n & 255)
+
+
+@contextmanager
+def benchmark_database():
+    # A migrated throwaway SQLite file, never db.sqlite3. A file rather than
+    # the shared in-memory test database so concurrent writers wait on the
+    # busy timeout instead of failing with "table is locked".
+    handle, path = tempfile.mkstemp(prefix='crud-bench-', suffix='.sqlite3')
+    os.close(handle)
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = path
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    # The read-only alias follows to the throwaway file.
+    replica = connections.settings.get(REPLICA_ALIAS)
+    old_replica_name = replica['NAME'] if replica else None
+    if replica:
+        connections[REPLICA_ALIAS].close()
+        replica['NAME'] = Path(path).as_uri() + '?mode=ro'
+    try:
+        caching.get_cache().clear()
+        gender_registry.clear()
+        yield path
+    finally:
+        if replica:
+            connections[REPLICA_ALIAS].close()
+            replica['NAME'] = old_replica_name
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        for leftover in (path, path + '-wal', path + '-shm'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def seed(users=1000, genders=len(GENDER_NAMES), chunk_size=1000):
+    # Bulk inserts, then the search index, statistics and data versions by
+    # hand, like import_users. Every seeded user shares one password hash.
+    Gender.objects.bulk_create([Gender(name=GENDER_NAMES[i] if i < len(GENDER_NAMES) else f'Gender {i}') for i in range(genders)])
+    gender_rows = list(Gender.objects.order_by('id'))
+    password = make_password(BENCH_PASSWORD)
+    for start in range(0, users, chunk_size):
+        batch = [
+            User(
+                username=f'user{n}',
+                first_name=f'First{n}',
+                last_name=f'Last{n % 97}',
+                email=f'user{n}@example.com',
+                password=password,
+            )
+            for n in range(start, min(start + chunk_size, users))
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(batch)
+            batch = list(User.objects.filter(username__in=[user.username for user in batch]))
+            Profile.objects.bulk_create([
+                Profile(user=user, gender=gender_rows[user.pk % len(gender_rows)] if gender_rows else None, address=f'{user.pk} Main Street')
+                for user in batch
+            ])
+            search.index_users(batch)
+    User.objects.create_superuser(BENCH_USERNAME, f'{BENCH_USERNAME}@example.com', BENCH_PASSWORD, first_name='Bench', last_name='Admin')
+    stats.rebuild()
+    caching.bump_version(caching.DIRECTORY, caching.GENDERS)
@@ -0,0 +1,98 @@
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+
+from crud.forms import UserCreateForm, UserUpdateForm
+from crud.genders import gender_registry
+
+from .fixtures import BENCH_USERNAME
+from .stats import summarize
+
+FRAGMENT_ALIAS = 'template_fragments'
+
+CONFIGURATIONS = ('uncached', 'cached_loader', 'cached_loader_fragments')
+
+
+def template_settings(cached_loader):
+    templates = copy.deepcopy(settings.TEMPLATES)
+    for engine in templates:
+        loaders = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+        engine['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', loaders)] if cached_loader else loaders
+    return templates
+
+
+def cache_settings(fragments):
+    caches = copy.deepcopy(settings.CACHES)
+    if not fragments:
+        caches[FRAGMENT_ALIAS] = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+    return caches
+
+
+def build_pages():
+    # (name, template, context factory). The contexts are built the way the
+    # views build them, with every query run before the timer starts, so
+    # only template loading and rendering are measured.
+    user = User.objects.select_related('profile').exclude(username=BENCH_USERNAME).order_by('id').first()
+
+    def user_edit():
+        initial = {'address': user.profile.address, 'date_of_birth': user.profile.date_of_birth, 'phone_number': user.profile.phone_number}
+        if user.profile.gender_id:
+            initial['gender'] = gender_registry.get(user.profile.gender_id)
+        return {'form': UserUpdateForm(instance=user, user_id=user.pk, initial=initial), 'title': 'Edit User'}
+
+    return [
+        ('user_list', 'user_list.html', lambda: {'search_query': '', 'genders': gender_registry.all(), 'csrf_cookie_name': settings.CSRF_COOKIE_NAME}),
+        ('gender_list', 'gender_list.html', lambda: {'genders': gender_registry.all()}),
+        ('user_add', 'user_form.html', lambda: {'form': UserCreateForm(), 'title': 'Add User'}),
+        ('user_edit', 'user_form.html', user_edit),
+    ]
+
+
+def time_page(request, template_name, make_context, iterations, warmup):
+    samples = []
+    for n in range(warmup + iterations):
+        context = make_context()
+        start = time.perf_counter()
+        render_to_string(template_name, context, request)
+        elapsed = time.perf_counter() - start
+        if n >= warmup:
+            samples.append(elapsed)
+    return summarize(samples)
+
+
+def run(iterations=200, warmup=5):
+    # {configuration: {page: summary}}. "uncached" parses every template on
+    # every render and renders every fragment, like the old settings.
+    request = RequestFactory().get('/')
+    request.user = User.objects.get(username=BENCH_USERNAME)
+    gender_registry.all()
+    pages = build_pages()
+    results = {}
+    for configuration in CONFIGURATIONS:
+        overrides = override_settings(
+            TEMPLATES=template_settings(cached_loader=configuration != 'uncached'),
+            CACHES=cache_settings(fragments=configuration == 'cached_loader_fragments'),
+        )
+        with overrides:
+            results[configuration] = {
+                name: time_page(request, template_name, make_context, iterations, warmup)
+                for name, template_name, make_context in pages
+            }
+    return results
+
+
+def savings(results, baseline='uncached'):
+    # Per page and configuration, the p50 saving against baseline in percent.
+    rows = []
+    for name, before in results[baseline].items():
+        for configuration, pages in results.items():
+            if configuration == baseline:
+                continue
+            after = pages[name]['p50_ms']
+            change = (before['p50_ms'] - after) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+            rows.append((name, configuration, before['p50_ms'], after, round(change, 1)))
+    return rows
@@ -0,0 +1,23 @@
+import statistics
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, elapsed=None):
+    # Latencies in milliseconds, throughput in requests per second.
+    summary = {
+        'requests': len(samples),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 2) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+    }
+    if elapsed:
+        summary['throughput'] = round(len(samples) / elapsed, 1)
+    return summary
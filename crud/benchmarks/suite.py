@@ -0,0 +1,161 @@
+import contextlib
+import itertools
+import platform
+import sqlite3
+import time
+
+import django
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db import connections, reset_queries
+from django.test import Client
+from django.urls import reverse
+
+from crud import caching
+from crud.directory import encode_cursor
+from crud.genders import gender_registry
+
+from .fixtures import BENCH_PASSWORD, BENCH_USERNAME, client_address
+from .stats import summarize
+
+XHR = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+
+class Scenario:
+    # One request shape. request(client, n) sends the n-th request and returns
+    # the response, expected_status is checked on every one of them.
+    def __init__(self, name, request, expected_status=200, reads=True):
+        self.name = name
+        self.request = request
+        self.expected_status = expected_status
+        self.reads = reads
+
+
+def build_scenarios():
+    user_ids = list(User.objects.exclude(username=BENCH_USERNAME).order_by('id').values_list('id', flat=True))
+    last_id = user_ids[-1] if user_ids else 0
+    deep_cursor = encode_cursor(user_ids[-11] if len(user_ids) > 10 else 0)
+    last_page = max(1, (len(user_ids) + 1 + 9) // 10)
+    genders = [gender.pk for gender in gender_registry.all()]
+    user_list = reverse('user_list')
+    counter = itertools.count()
+
+    def login(client, n):
+        return Client(REMOTE_ADDR=client_address(n)).post(reverse('login'), {'form_type': 'login', 'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+
+    def user_add(client, n):
+        number = next(counter)
+        return client.post(reverse('user_add'), {
+            'username': f'bench-add-{number}',
+            'first_name': 'Bench',
+            'last_name': f'Added{number}',
+            'email': f'bench-add-{number}@example.com',
+            'password': 'bench-add-password',
+            'confirm_password': 'bench-add-password',
+            'gender': genders[number % len(genders)] if genders else '',
+            'address': f'{number} Benchmark Road',
+            'phone_number': '5550100',
+        })
+
+    def user_edit(client, n):
+        user_id = user_ids[n % len(user_ids)]
+        return client.post(reverse('user_edit', args=[user_id]), {
+            'username': f'user-edited-{user_id}',
+            'first_name': f'First{user_id}',
+            'last_name': f'Edited{n}',
+            'email': f'user{user_id}@example.com',
+            'gender': genders[n % len(genders)] if genders else '',
+            'address': f'{n} Edited Street',
+            'phone_number': '5550199',
+        })
+
+    return [
+        Scenario('login', login, expected_status=302, reads=False),
+        Scenario('user_list_html', lambda client, n: client.get(user_list)),
+        Scenario('user_list_html_search', lambda client, n: client.get(user_list, {'search': 'Last1'})),
+        Scenario('user_list_html_deep', lambda client, n: client.get(user_list, {'page': last_page})),
+        Scenario('user_list_xhr', lambda client, n: client.get(user_list, {'mode': 'cursor', 'count': '1'}, **XHR)),
+        Scenario('user_list_xhr_deep', lambda client, n: client.get(user_list, {'mode': 'cursor', 'after': deep_cursor}, **XHR)),
+        Scenario('user_list_xhr_search', lambda client, n: client.get(user_list, {'mode': 'cursor', 'search': 'First1', 'count': '1'}, **XHR)),
+        Scenario('user_list_xhr_search_deep', lambda client, n: client.get(user_list, {'mode': 'cursor', 'search': 'example', 'before': encode_cursor(last_id + 1)}, **XHR)),
+        Scenario('user_list_xhr_page_deep', lambda client, n: client.get(user_list, {'page': last_page}, **XHR)),
+        Scenario('user_add', user_add, expected_status=302, reads=False),
+        Scenario('user_edit', user_edit, expected_status=302, reads=False),
+    ]
+
+
+@contextlib.contextmanager
+def count_queries():
+    # Reads may be routed to the replica, so count the queries on every alias.
+    # Unlike CaptureQueriesContext this doesn't open a connection an alias
+    # never uses.
+    aliases = list(connections)
+    debug = {alias: connections[alias].force_debug_cursor for alias in aliases}
+    start = {alias: len(connections[alias].queries_log) for alias in aliases}
+    captured = {'queries': 0}
+    request_started.disconnect(reset_queries)
+    for alias in aliases:
+        connections[alias].force_debug_cursor = True
+    try:
+        yield captured
+    finally:
+        for alias in aliases:
+            connections[alias].force_debug_cursor = debug[alias]
+        request_started.connect(reset_queries)
+        captured['queries'] = sum(len(connections[alias].queries_log) - start[alias] for alias in aliases)
+
+
+def run_scenario(scenario, client, iterations, warmup, warm_cache=False):
+    samples = []
+    queries = []
+    for n in range(warmup + iterations):
+        if scenario.reads and not warm_cache:
+            # Miss the page cache every time but keep the gender registry warm.
+            caching.bump_version(caching.DIRECTORY)
+        with count_queries() as captured:
+            start = time.perf_counter()
+            response = scenario.request(client, n)
+            elapsed = time.perf_counter() - start
+        if response.status_code != scenario.expected_status:
+            raise AssertionError(f"{scenario.name}: expected a {scenario.expected_status} response, got {response.status_code}.")
+        if n >= warmup:
+            samples.append(elapsed)
+            queries.append(captured['queries'])
+    result = summarize(samples)
+    result['queries'] = max(queries) if queries else 0
+    return result
+
+
+def run(iterations=20, warmup=3, names=None, warm_cache=False):
+    client = Client()
+    client.force_login(User.objects.get(username=BENCH_USERNAME))
+    results = {}
+    for scenario in build_scenarios():
+        if names and scenario.name not in names:
+            continue
+        results[scenario.name] = run_scenario(scenario, client, iterations, warmup, warm_cache)
+    return results
+
+
+def environment(**options):
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        **options,
+    }
+
+
+def compare(current, baseline, threshold=20.0):
+    # One row per scenario in both runs. A scenario regresses when its p50
+    # grows by more than threshold percent or it issues more queries.
+    rows = []
+    for name, result in current.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        change = (result['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] * 100 if previous['p50_ms'] else 0.0
+        regressed = change > threshold or result['queries'] > previous['queries']
+        rows.append((name, previous['p50_ms'], result['p50_ms'], round(change, 1), previous['queries'], result['queries'], regressed))
+    return rows
@@ -0,0 +1,92 @@
+import logging
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.db import close_old_connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from crud import caching
+
+from .fixtures import BENCH_PASSWORD, BENCH_USERNAME, client_address
+from .stats import summarize
+
+PHASES = ('quiet', 'attack', 'attack_throttled')
+
+# Attackers come from a handful of addresses, far from the range that
+# client_address() hands out to legitimate users.
+ATTACK_NETWORK = '203.0.113.%d'
+
+
+def sign_in(username, password, address):
+    return Client(REMOTE_ADDR=address).post(reverse('login'), {'form_type': 'login', 'username': username, 'password': password})
+
+
+def loop(stop, task, samples, statuses):
+    rng = random.Random(threading.get_ident())
+    while not stop.is_set():
+        start = time.perf_counter()
+        status = task(rng).status_code
+        samples.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+        close_old_connections()
+
+
+def run_phase(usernames, users, attackers, attack_addresses, duration, warmup):
+    # `attackers` threads post wrong passwords for random usernames. After
+    # `warmup` seconds, so the attack has used up its allowance, `users`
+    # threads sign in with the right password for `duration` seconds, each
+    # attempt as the next user from its own address.
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def legitimate(rng):
+        with lock:
+            n = next(counter)
+        return sign_in(usernames[n % len(usernames)], BENCH_PASSWORD, client_address(n))
+
+    def attack(rng):
+        address = ATTACK_NETWORK % rng.randint(1, attack_addresses)
+        return sign_in(rng.choice(usernames), 'not-the-password', address)
+
+    stop = threading.Event()
+    legit_samples, legit_statuses, attack_samples, attack_statuses = [], {}, [], {}
+    attack_threads = [threading.Thread(target=loop, args=(stop, attack, attack_samples, attack_statuses)) for _ in range(attackers)]
+    legit_threads = [threading.Thread(target=loop, args=(stop, legitimate, legit_samples, legit_statuses)) for _ in range(users)]
+    for thread in attack_threads:
+        thread.start()
+    if attack_threads:
+        time.sleep(warmup)
+    for thread in legit_threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in attack_threads + legit_threads:
+        thread.join()
+    return {
+        'legitimate': dict(summarize(legit_samples, duration), statuses=legit_statuses),
+        'attack': dict(summarize(attack_samples, duration + warmup), statuses=attack_statuses),
+    }
+
+
+def run(users=2, attackers=8, attack_addresses=1, duration=5.0, warmup=10.0):
+    # quiet: legitimate sign-ins alone. attack: the same under a
+    # credential-stuffing burst with the throttle off. attack_throttled: the
+    # burst again with CRUD_THROTTLE_RATES as configured.
+    usernames = list(User.objects.exclude(username=BENCH_USERNAME).values_list('username', flat=True))
+    # django.request logs a warning for every 429.
+    request_logger = logging.getLogger('django.request')
+    level = request_logger.level
+    request_logger.setLevel(logging.ERROR)
+    results = {}
+    try:
+        for phase in PHASES:
+            caching.get_cache().clear()
+            overrides = override_settings() if phase == 'attack_throttled' else override_settings(CRUD_THROTTLE_RATES={})
+            with overrides:
+                results[phase] = run_phase(usernames, users, attackers if phase != 'quiet' else 0, attack_addresses, duration, warmup)
+    finally:
+        request_logger.setLevel(level)
+    return results
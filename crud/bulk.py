@@ -0,0 +1,149 @@
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+from . import caching, search, stats
+from .directory import filter_users, visible_users
+from .models import Profile
+
+# Rows touched per transaction, small enough that SQLite's write lock is only
+# ever held for a moment.
+CHUNK_SIZE = 500
+
+# Users hard-deleted per purge transaction. Smaller, every user cascades to
+# its profile, sessions and admin log entries.
+PURGE_CHUNK_SIZE = 100
+
+ACTIONS = ('delete', 'set_gender', 'deactivate')
+
+
+def selected_users(user_ids=None, search_query=None):
+    # Either the explicit ids, or every user matching the search.
+    if search_query is not None:
+        return filter_users(search_query)
+    return visible_users().filter(id__in=user_ids or [])
+
+
+def id_chunks(users, chunk_size=CHUNK_SIZE):
+    # Fetch one primary-key range at a time instead of every id up front.
+    users = users.order_by('id').values_list('id', flat=True)
+    last_id = 0
+    while True:
+        chunk = list(users.filter(id__gt=last_id)[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]
+
+
+def delete_users(chunks):
+    affected = 0
+    with caching.deferred_bumps():
+        for chunk in chunks:
+            # The collector loads the chunk's users and profiles in one query
+            # each and deletes them with one DELETE per table. The counters
+            # are updated in the chunk's transaction.
+            with transaction.atomic(), search.deferred_unindex(), stats.deferred_counts():
+                deleted = User.objects.filter(id__in=chunk).delete()[1]
+            affected += deleted.get(User._meta.label, 0)
+    return affected
+
+
+def set_gender(chunks, gender):
+    affected = 0
+    for chunk in chunks:
+        with transaction.atomic():
+            # update() and bulk_create() send no signals, so count by hand.
+            current = list(Profile.objects.filter(user_id__in=chunk).values_list('user_id', 'gender_id'))
+            with_profile = {user_id for user_id, _ in current}
+            Profile.objects.filter(user_id__in=chunk).update(gender=gender)
+            created = Profile.objects.bulk_create([Profile(user_id=user_id, gender=gender) for user_id in chunk if user_id not in with_profile])
+            deltas = {}
+            for _, gender_id in current:
+                stats.merge(deltas, {(stats.GENDER, str(gender_id) if gender_id else ''): -1, (stats.GENDER, str(gender.pk) if gender else ''): 1})
+            for profile in created:
+                stats.merge(deltas, stats.profile_deltas(profile.gender_id, None))
+            stats.apply(deltas)
+        affected += len(chunk)
+    caching.bump_version(caching.DIRECTORY)
+    return affected
+
+
+def deactivate_users(chunks):
+    affected = 0
+    for chunk in chunks:
+        with transaction.atomic():
+            affected += User.objects.filter(id__in=chunk, is_active=True).update(is_active=False)
+    return affected
+
+
+def soft_delete_users(chunks):
+    # Two UPDATEs per chunk whatever hangs off the users: flag their
+    # profiles deleted and the users inactive, which also signs them out.
+    # Their rows stay until purge_deleted_users.
+    affected = 0
+    now = timezone.now()
+    for chunk in chunks:
+        with transaction.atomic():
+            users = list(visible_users().filter(id__in=chunk).select_related('profile'))
+            deltas, missing = {}, []
+            for user in users:
+                stats.merge(deltas, stats.user_deltas(user, -1))
+                if hasattr(user, 'profile'):
+                    stats.merge(deltas, stats.profile_deltas(user.profile.gender_id, user.profile.date_of_birth, -1))
+                else:
+                    missing.append(Profile(user_id=user.pk, deleted_at=now, was_active=user.is_active))
+            user_ids = [user.pk for user in users]
+            Profile.objects.filter(user_id__in=user_ids).update(
+                deleted_at=now, was_active=Subquery(User.objects.filter(pk=OuterRef('user_id')).values('is_active')),
+            )
+            Profile.objects.bulk_create(missing)
+            User.objects.filter(id__in=user_ids).update(is_active=False)
+            # update() and bulk_create() send no signals, so count by hand.
+            stats.apply(deltas)
+        affected += len(users)
+    caching.bump_version(caching.DIRECTORY)
+    return affected
+
+
+def restore_users(chunks):
+    # Undo soft_delete_users. Users get back the is_active they had when
+    # they were deleted, so a deactivated user stays deactivated.
+    affected = 0
+    for chunk in chunks:
+        with transaction.atomic():
+            profiles = list(Profile.objects.filter(user_id__in=chunk, deleted_at__isnull=False).select_related('user'))
+            deltas = {}
+            for profile in profiles:
+                stats.merge(deltas, stats.user_deltas(profile.user))
+                stats.merge(deltas, stats.profile_deltas(profile.gender_id, profile.date_of_birth))
+            user_ids = [profile.user_id for profile in profiles]
+            Profile.objects.filter(user_id__in=user_ids).update(deleted_at=None)
+            User.objects.filter(id__in=[profile.user_id for profile in profiles if profile.was_active]).update(is_active=True)
+            stats.apply(deltas)
+        affected += len(profiles)
+    caching.bump_version(caching.DIRECTORY)
+    return affected
+
+
+def purge_deleted_users(deleted_before, chunk_size=PURGE_CHUNK_SIZE, pause=0):
+    # Hard-delete users soft-deleted before `deleted_before`, oldest first,
+    # one short transaction per chunk.
+    purged = 0
+    pending = Profile.objects.filter(deleted_at__lt=deleted_before).order_by('deleted_at', 'user_id').values_list('user_id', flat=True)
+    with caching.deferred_bumps():
+        while True:
+            chunk = list(pending[:chunk_size])
+            if not chunk:
+                return purged
+            # Their counters came off at soft delete already. The filter is
+            # repeated so a user restored meanwhile is kept.
+            with transaction.atomic(), search.deferred_unindex(), stats.discarded_counts():
+                deleted = User.objects.filter(id__in=chunk, profile__deleted_at__lt=deleted_before).delete()[1]
+            purged += deleted.get(User._meta.label, 0)
+            if pause:
+                time.sleep(pause)
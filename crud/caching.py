@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.encoding import force_bytes
+
+# Data-version scopes. DIRECTORY covers everything user_list renders (User,
+# Profile and Gender), GENDERS only the Gender table.
+DIRECTORY = 'directory'
+GENDERS = 'genders'
+
+PAGE_CACHE_TIMEOUT = 60 * 10
+
+_deferred = threading.local()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CRUD_CACHE_ALIAS', 'default')]
+
+
+def get_shared_cache():
+    return caches[getattr(settings, 'CRUD_SHARED_CACHE_ALIAS', 'shared')]
+
+
+def _version_key(scope):
+    return 'crud:version:%s' % scope
+
+
+def get_version(scope):
+    # Versions live in the shared cache, so a bump from any process, a
+    # management command included, reaches every worker at once. Only the
+    # entries keyed by them stay in the per-process CRUD_CACHE_ALIAS.
+    cache = get_shared_cache()
+    version = cache.get(_version_key(scope))
+    if version is None:
+        cache.add(_version_key(scope), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(scope))
+    return version
+
+
+async def aget_version(scope):
+    # get_version() for coroutines. The async cache methods never block the
+    # event loop, even on the file-based backend.
+    cache = get_shared_cache()
+    version = await cache.aget(_version_key(scope))
+    if version is None:
+        await cache.aadd(_version_key(scope), uuid.uuid4().hex, None)
+        version = await cache.aget(_version_key(scope))
+    return version
+
+
+def bump_version(*scopes):
+    # Versions are random tokens rather than counters: a plain set() is atomic
+    # on every backend, including the file-based one shared between workers.
+    pending = getattr(_deferred, 'scopes', None)
+    if pending is not None:
+        pending.update(scopes)
+        return
+    _set_versions(scopes)
+    # A reader between this bump and the commit could cache pre-write data
+    # under the new version, so bump again once the write is visible.
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _set_versions(scopes))
+
+
+def _set_versions(scopes):
+    get_shared_cache().set_many({_version_key(scope): uuid.uuid4().hex for scope in scopes}, None)
+
+
+@contextmanager
+def deferred_bumps():
+    # Collapse the per-row signal bumps of a bulk write into one bump per scope.
+    if getattr(_deferred, 'scopes', None) is not None:
+        yield
+        return
+    _deferred.scopes = set()
+    try:
+        yield
+    finally:
+        scopes, _deferred.scopes = _deferred.scopes, None
+        if scopes:
+            bump_version(*scopes)
+
+
+def _versioned(prefix, version, parts):
+    digest = hashlib.md5(force_bytes(repr(parts))).hexdigest()
+    return 'crud:%s:%s:%s' % (prefix, version, digest)
+
+
+def versioned_key(prefix, scope, *parts):
+    return _versioned(prefix, get_version(scope), parts)
+
+
+async def aversioned_key(prefix, scope, *parts):
+    return _versioned(prefix, await aget_version(scope), parts)
@@ -0,0 +1,9 @@
+from django.utils.functional import SimpleLazyObject
+
+from . import caching
+
+
+def data_versions(request):
+    # For {% cache %} keys. Lazy, so pages without a fragment never look the
+    # version up.
+    return {'genders_version': SimpleLazyObject(lambda: caching.get_version(caching.GENDERS))}
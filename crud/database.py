@@ -0,0 +1,30 @@
+from django.conf import settings
+
+# Applied in this order: journal_mode needs the connection to itself, so it
+# goes first.
+PRAGMA_ORDER = ('journal_mode', 'busy_timeout', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+
+def sqlite_pragmas():
+    profile = settings.CRUD_DB_PROFILES.get(settings.CRUD_DB_PROFILE, {})
+    return profile.get('PRAGMAS', {})
+
+
+def read_only(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = sqlite_pragmas()
+    if not pragmas:
+        return
+    names = sorted(pragmas, key=lambda name: PRAGMA_ORDER.index(name) if name in PRAGMA_ORDER else len(PRAGMA_ORDER))
+    with connection.cursor() as cursor:
+        for name in names:
+            # A read-only connection cannot change the journal mode, it
+            # follows whatever the primary set.
+            if name == 'journal_mode' and (connection.is_in_memory_db() or read_only(connection)):
+                continue
+            cursor.execute('PRAGMA %s = %s' % (name, pragmas[name]))
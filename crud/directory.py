@@ -0,0 +1,227 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.encoding import force_bytes, force_str
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .caching import DIRECTORY, PAGE_CACHE_TIMEOUT, aversioned_key, get_cache, versioned_key
+from .genders import gender_registry
+from .search import search_users
+
+PAGE_SIZE = 10
+
+# Query parameters that select a user_list JSON page.
+DIRECTORY_PARAMS = ('search', 'mode', 'after', 'before', 'page', 'count')
+
+DIRECTORY_FIELDS = (
+    'id',
+    'username',
+    'first_name',
+    'last_name',
+    'email',
+    'profile__gender_id',
+    'profile__address',
+    'profile__date_of_birth',
+)
+
+
+def visible_users():
+    # Soft-deleted users keep their auth_user row until purge_deleted_users
+    # runs. The LEFT JOIN keeps users that have no profile.
+    return User.objects.filter(profile__deleted_at__isnull=True)
+
+
+def filter_users(search_query=''):
+    users = visible_users().order_by('id')
+    if search_query:
+        users = search_users(users, search_query)
+    return users
+
+
+def directory_queryset(search_query=''):
+    # One LEFT JOIN over auth_user -> crud_profile that only selects the
+    # columns the directory renders, gender names come from the registry.
+    return filter_users(search_query).values(*DIRECTORY_FIELDS)
+
+
+class DirectoryPaginator(Paginator):
+    def __init__(self, users, per_page):
+        super().__init__(users.values(*DIRECTORY_FIELDS), per_page)
+        self.users = users
+
+    @cached_property
+    def count(self):
+        # Count without the selected profile columns, they never change it.
+        return self.users.count()
+
+
+def directory_page(search_query='', page_number=None, per_page=PAGE_SIZE):
+    paginator = DirectoryPaginator(filter_users(search_query), per_page)
+    return paginator.get_page(page_number)
+
+
+def encode_cursor(user_id):
+    return urlsafe_base64_encode(force_bytes(user_id))
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return int(force_str(urlsafe_base64_decode(cursor)))
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+class KeysetPage:
+    def __init__(self, rows, has_previous, has_next):
+        self.rows = rows
+        self.has_previous = has_previous
+        self.has_next = has_next
+
+
+def keyset_slice(users, after=None, before=None, per_page=PAGE_SIZE):
+    # Seek on the primary key instead of OFFSET so every page costs the same
+    # single indexed range scan, however deep it is.
+    if before is not None:
+        return users.filter(id__lt=before).order_by('-id').values(*DIRECTORY_FIELDS)[:per_page + 1]
+    if after is not None:
+        users = users.filter(id__gt=after)
+    return users.values(*DIRECTORY_FIELDS)[:per_page + 1]
+
+
+def build_keyset_page(rows, after=None, before=None, per_page=PAGE_SIZE):
+    if before is not None:
+        return KeysetPage(rows[:per_page][::-1], len(rows) > per_page, True)
+    return KeysetPage(rows[:per_page], after is not None, len(rows) > per_page)
+
+
+def keyset_page(search_query='', after=None, before=None, per_page=PAGE_SIZE):
+    rows = list(keyset_slice(filter_users(search_query), after, before, per_page))
+    return build_keyset_page(rows, after, before, per_page)
+
+
+async def akeyset_page(users, after=None, before=None, per_page=PAGE_SIZE):
+    rows = [row async for row in keyset_slice(users, after, before, per_page)]
+    return build_keyset_page(rows, after, before, per_page)
+
+
+def directory_count(search_query=''):
+    cache = get_cache()
+    key = versioned_key('directory_count', DIRECTORY, search_query)
+    count = cache.get(key)
+    if count is None:
+        count = filter_users(search_query).count()
+        cache.set(key, count, PAGE_CACHE_TIMEOUT)
+    return count
+
+
+async def adirectory_count(users, search_query=''):
+    cache = get_cache()
+    key = await aversioned_key('directory_count', DIRECTORY, search_query)
+    count = await cache.aget(key)
+    if count is None:
+        count = await users.acount()
+        await cache.aset(key, count, PAGE_CACHE_TIMEOUT)
+    return count
+
+
+def serialize_row(row, genders):
+    gender = genders.get(row['profile__gender_id'])
+    return {
+        'id': row['id'],
+        'username': row['username'],
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'email': row['email'],
+        'gender': gender.name if gender is not None else '',
+        'address': row['profile__address'] or '',
+        'date_of_birth': row['profile__date_of_birth'] or '',
+    }
+
+
+def serialize_page(page_obj):
+    genders = gender_registry.mapping()
+    return {
+        'users': [serialize_row(row, genders) for row in page_obj],
+        'has_previous': page_obj.has_previous(),
+        'has_next': page_obj.has_next(),
+        'previous_page_number': page_obj.previous_page_number() if page_obj.has_previous() else None,
+        'next_page_number': page_obj.next_page_number() if page_obj.has_next() else None,
+        'current_page': page_obj.number,
+        'num_pages': page_obj.paginator.num_pages,
+    }
+
+
+def serialize_keyset_page(page, genders=None):
+    rows = page.rows
+    genders = gender_registry.mapping() if genders is None else genders
+    return {
+        'users': [serialize_row(row, genders) for row in rows],
+        'has_previous': page.has_previous and bool(rows),
+        'has_next': page.has_next and bool(rows),
+        'prev_cursor': encode_cursor(rows[0]['id']) if page.has_previous and rows else None,
+        'next_cursor': encode_cursor(rows[-1]['id']) if page.has_next and rows else None,
+    }
+
+
+def directory_data(params):
+    # The JSON body for one user_list XHR, raises ValueError on a bad cursor.
+    search_query = params.get('search', '')
+    if params.get('mode') == 'cursor':
+        after = decode_cursor(params.get('after'))
+        before = decode_cursor(params.get('before'))
+        data = serialize_keyset_page(keyset_page(search_query, after=after, before=before))
+        if params.get('count'):
+            data['total_count'] = directory_count(search_query)
+        return data
+    return serialize_page(directory_page(search_query, params.get('page')))
+
+
+async def adirectory_data(params):
+    # Cursor mode runs on the async ORM, the legacy page mode still goes
+    # through Paginator in a worker thread.
+    if params.get('mode') != 'cursor':
+        return await sync_to_async(directory_data)(params)
+    search_query = params.get('search', '')
+    after = decode_cursor(params.get('after'))
+    before = decode_cursor(params.get('before'))
+    # Building the queryset may probe the connection for FTS5 support.
+    users = await sync_to_async(filter_users)(search_query)
+    genders = await gender_registry.amapping()
+    data = serialize_keyset_page(await akeyset_page(users, after=after, before=before), genders)
+    if params.get('count'):
+        data['total_count'] = await adirectory_count(users, search_query)
+    return data
+
+
+def directory_cache_key(params):
+    return versioned_key('directory_page', DIRECTORY, *[params.get(name, '') for name in DIRECTORY_PARAMS])
+
+
+async def adirectory_cache_key(params):
+    return await aversioned_key('directory_page', DIRECTORY, *[params.get(name, '') for name in DIRECTORY_PARAMS])
+
+
+def cached_directory_json(params):
+    cache = get_cache()
+    key = directory_cache_key(params)
+    content = cache.get(key)
+    if content is None:
+        content = json.dumps(directory_data(params), cls=DjangoJSONEncoder)
+        cache.set(key, content, PAGE_CACHE_TIMEOUT)
+    return content
+
+
+async def acached_directory_json(params):
+    cache = get_cache()
+    key = await adirectory_cache_key(params)
+    content = await cache.aget(key)
+    if content is None:
+        content = json.dumps(await adirectory_data(params), cls=DjangoJSONEncoder)
+        await cache.aset(key, content, PAGE_CACHE_TIMEOUT)
+    return content
@@ -0,0 +1,83 @@
+import csv
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .directory import filter_users
+from .genders import gender_registry
+
+EXPORT_COLUMNS = ('id', 'username', 'first_name', 'last_name', 'email', 'gender', 'address', 'date_of_birth', 'phone_number')
+EXPORT_FIELDS = (
+    'id', 'username', 'first_name', 'last_name', 'email',
+    'profile__gender_id', 'profile__address', 'profile__date_of_birth', 'profile__phone_number',
+)
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+
+def export_rows(search_query='', chunk_size=CHUNK_SIZE):
+    # Walk the directory in primary-key chunks, each its own short query, so
+    # memory stays flat and no read lock is held across the whole export.
+    users = filter_users(search_query).values_list(*EXPORT_FIELDS)
+    last_id = 0
+    while True:
+        rows = list(users.filter(id__gt=last_id)[:chunk_size])
+        for row in rows:
+            row = list(row)
+            row[5] = gender_registry.name(row[5])
+            yield row
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    # Group rows into larger chunks instead of one write per row.
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def export_chunks(file_format, search_query='', chunk_size=CHUNK_SIZE):
+    lines = ndjson_lines if file_format == 'ndjson' else csv_lines
+    return buffered(lines(export_rows(search_query, chunk_size)))
+
+
+async def async_chunks(chunks):
+    # Under ASGI a sync iterator is consumed whole before the first byte is
+    # sent, so pull one chunk at a time from a thread instead.
+    chunks = iter(chunks)
+    try:
+        while True:
+            chunk = await sync_to_async(next)(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
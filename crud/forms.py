@@ -1,12 +1,63 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.forms.boundfield import BoundField
+from django.forms.models import ModelChoiceIterator
 from .models import Gender, Profile
+from .genders import gender_registry
+from .passwords import IDENTIFIER_MAX_LENGTH, resolve_user
+
+class GenderChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for gender in gender_registry.all():
+            yield self.choice(gender)
+
+    def __len__(self):
+        return len(gender_registry.all()) + (self.field.empty_label is not None)
+
+class GenderBoundField(BoundField):
+    def selected_key(self):
+        # The pk of the option the select renders as selected, '' for none.
+        # value() is a Gender's pk unbound but the posted string bound, and
+        # may be anything posted, so it can't key the cached select as is.
+        value = '' if self.value() is None else str(self.value())
+        return value if value in {str(gender.pk) for gender in gender_registry.all()} else ''
+
+class GenderChoiceField(forms.ModelChoiceField):
+    # Choices and validation come from the in-process registry, so rendering
+    # or validating a form never queries crud_gender. Genders queued for
+    # removal are neither offered nor accepted.
+    iterator = GenderChoiceIterator
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Gender.objects.all(), **kwargs)
+
+    def get_bound_field(self, form, field_name):
+        return GenderBoundField(form, self, field_name)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, Gender):
+            value = value.pk
+        try:
+            gender = gender_registry.get(int(value))
+        except (TypeError, ValueError):
+            gender = None
+        if gender is None or not gender.is_active:
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return gender
 
 class UserCreateForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput(attrs={'class': 'form-control', 'required': True}))
     confirm_password = forms.CharField(widget=forms.PasswordInput(attrs={'class': 'form-control', 'required': True}))
-    gender = forms.ModelChoiceField(queryset=Gender.objects.all(), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    gender = GenderChoiceField(required=False, widget=forms.Select(attrs={'class': 'form-control'}))
     address = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
     date_of_birth = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
     phone_number = forms.IntegerField(required=True, widget=forms.NumberInput(attrs={'class': 'form-control'}))
@@ -45,7 +96,7 @@ class UserCreateForm(forms.ModelForm):
         return cleaned_data
 
 class UserUpdateForm(forms.ModelForm):
-    gender = forms.ModelChoiceField(queryset=Gender.objects.all(), required=False, widget=forms.Select(attrs={'class': 'form-control'}))
+    gender = GenderChoiceField(required=False, widget=forms.Select(attrs={'class': 'form-control'}))
     address = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
     date_of_birth = forms.DateField(required=False, widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}))
     phone_number = forms.IntegerField(required=True, widget=forms.NumberInput(attrs={'class': 'form-control'}))
@@ -141,11 +192,16 @@ class AdminChangePasswordForm(forms.Form):
 class ResetPasswordForm(forms.Form):
     username_or_email = forms.CharField(
         label="Username or Email",
+        max_length=IDENTIFIER_MAX_LENGTH,
         widget=forms.TextInput(attrs={'class': 'form-control', 'required': True})
     )
 
+    # The matched user once the form is valid.
+    user = None
+
     def clean_username_or_email(self):
         data = self.cleaned_data['username_or_email']
-        if not User.objects.filter(username=data).exists() and not User.objects.filter(email=data).exists():
+        self.user = resolve_user(data)
+        if self.user is None:
             raise ValidationError("No user found with this username or email.")
         return data
@@ -0,0 +1,127 @@
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import caching, stats
+from .genders import gender_registry
+from .models import Gender, GenderReassignment, Profile
+
+# Profiles moved per transaction, so SQLite's write lock is only ever held
+# for a moment, like crud.bulk.
+CHUNK_SIZE = 500
+
+UNFINISHED = (GenderReassignment.PENDING, GenderReassignment.RUNNING)
+
+# A running job whose worker has not finished a chunk for this long is
+# taken to be dead and handed to the next worker. Keep --pause well below.
+STALE_AFTER = timedelta(minutes=5)
+
+
+def schedule_removal(gender, target=None):
+    # Hide the gender right away and leave moving its profiles to the
+    # worker. Saving is_active bumps the GENDERS version, so the registry,
+    # forms and cached fragments drop it on their next read.
+    with transaction.atomic():
+        gender.is_active = False
+        gender.save(update_fields=['is_active'])
+        return GenderReassignment.objects.create(
+            gender=gender,
+            gender_name=gender.name,
+            target=target,
+            # Every profile moves, soft-deleted ones included, so a restore
+            # finds the user under the new gender.
+            total=Profile.objects.filter(gender=gender).count(),
+        )
+
+
+def recent_jobs(limit=10):
+    # Jobs still running or queued, and failed ones, oldest first.
+    # Targets come from the registry, not a join on crud_gender.
+    jobs = list(GenderReassignment.objects.exclude(status=GenderReassignment.DONE).order_by('id')[:limit])
+    for job in jobs:
+        if job.target_id is not None:
+            job.target = gender_registry.get(job.target_id)
+    return jobs
+
+
+def is_pending_target(gender):
+    return GenderReassignment.objects.filter(target=gender, status__in=UNFINISHED).exists()
+
+
+def claimable(now):
+    # Pending jobs, and running ones left behind by a worker that died.
+    return Q(status=GenderReassignment.PENDING) | Q(status=GenderReassignment.RUNNING, heartbeat_at__lt=now - STALE_AFTER)
+
+
+def claim_next():
+    # The oldest claimable job, marked running with a conditional UPDATE so
+    # two workers never pick the same one. Moving profiles is idempotent, so
+    # a reclaimed job just carries on.
+    now = timezone.now()
+    for job in GenderReassignment.objects.filter(claimable(now)).order_by('id')[:5]:
+        if GenderReassignment.objects.filter(claimable(now), pk=job.pk).update(status=GenderReassignment.RUNNING, heartbeat_at=now):
+            job.status = GenderReassignment.RUNNING
+            job.heartbeat_at = now
+            return job
+    return None
+
+
+def move_chunk(job, chunk_size=CHUNK_SIZE):
+    # Returns how many profiles moved, 0 once the gender has none left. A
+    # job whose gender is already deleted (gender_id nulled) is finished,
+    # filtering on gender_id=None would match every profile without one.
+    if job.gender_id is None:
+        return 0
+    with transaction.atomic():
+        ids = list(Profile.objects.filter(gender_id=job.gender_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return 0
+        # update() sends no signals, so count and invalidate by hand.
+        # Soft-deleted profiles are out of the counters until restored.
+        counted = Profile.objects.filter(pk__in=ids, gender_id=job.gender_id, deleted_at__isnull=True).update(gender_id=job.target_id)
+        moved = counted + Profile.objects.filter(pk__in=ids, gender_id=job.gender_id).update(gender_id=job.target_id)
+        stats.apply({(stats.GENDER, str(job.gender_id)): -counted, (stats.GENDER, str(job.target_id) if job.target_id else ''): counted})
+        GenderReassignment.objects.filter(pk=job.pk).update(processed=F('processed') + moved, heartbeat_at=timezone.now())
+        caching.bump_version(caching.DIRECTORY)
+    job.processed += moved
+    return len(ids)
+
+
+def finish(job, status, error=''):
+    job.status = status
+    job.last_error = error
+    job.finished_at = timezone.now()
+    GenderReassignment.objects.filter(pk=job.pk).update(status=job.status, last_error=job.last_error, finished_at=job.finished_at)
+
+
+def run_job(job, chunk_size=CHUNK_SIZE, pause=0):
+    try:
+        while move_chunk(job, chunk_size):
+            # Room for request threads to take the write lock in between.
+            if pause:
+                time.sleep(pause)
+        # Deleting the gender nulls job.gender_id, so the job is marked done
+        # in the same transaction and is never reclaimed without its gender.
+        with transaction.atomic():
+            gender = Gender.objects.filter(pk=job.gender_id).first() if job.gender_id is not None else None
+            if gender is not None:
+                gender.delete()
+            finish(job, GenderReassignment.DONE)
+    except Exception as e:
+        finish(job, GenderReassignment.FAILED, str(e))
+    # gender_list lists unfinished jobs and its ETag follows the GENDERS version.
+    caching.bump_version(caching.GENDERS)
+    return job
+
+
+def run_pending(chunk_size=CHUNK_SIZE, pause=0):
+    # Runs queued jobs until none are left and returns them.
+    finished = []
+    while True:
+        job = claim_next()
+        if job is None:
+            return finished
+        finished.append(run_job(job, chunk_size, pause))
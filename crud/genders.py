@@ -0,0 +1,64 @@
+import threading
+
+from . import caching
+
+
+class GenderRegistry:
+    # Process-local copy of the Gender table. Every lookup compares the cached
+    # GENDERS data version, which the Gender save/delete signals replace, and
+    # reloads from the database only after it moved.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._genders = {}
+
+    def _current(self):
+        version = caching.get_version(caching.GENDERS)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    from .models import Gender
+                    self._genders = {gender.pk: gender for gender in Gender.objects.order_by('id')}
+                    self._version = version
+        return self._genders
+
+    async def _acurrent(self):
+        version = await caching.aget_version(caching.GENDERS)
+        if version != self._version:
+            from .models import Gender
+            genders = {gender.pk: gender async for gender in Gender.objects.order_by('id')}
+            with self._lock:
+                self._genders = genders
+                self._version = version
+        return self._genders
+
+    def mapping(self):
+        return self._current()
+
+    async def amapping(self):
+        return await self._acurrent()
+
+    def all(self):
+        # Active genders, the ones forms offer and lists show. mapping() and
+        # get() still resolve genders queued for removal, whose profiles
+        # have not all been moved yet.
+        return [gender for gender in self._current().values() if gender.is_active]
+
+    async def aall(self):
+        return [gender for gender in (await self._acurrent()).values() if gender.is_active]
+
+    def get(self, pk):
+        return self._current().get(pk)
+
+    def name(self, pk):
+        gender = self.get(pk)
+        return gender.name if gender is not None else ''
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._genders = {}
+
+
+gender_registry = GenderRegistry()
@@ -0,0 +1,69 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from crud.benchmarks import suite
+from crud.benchmarks.fixtures import benchmark_database, seed
+
+COLUMNS = ('p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'queries')
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and time the crud views through the test "
+        "client. Writes the results as JSON and compares them against an "
+        "earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--genders', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--scenario', action='append', dest='scenarios', help="Only run this scenario, may be repeated.")
+        parser.add_argument('--warm-cache', action='store_true', help="Let reads hit the directory page cache.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--baseline', help="Compare against a JSON file written by --output.")
+        parser.add_argument('--threshold', type=float, default=20.0, help="Allowed p50 slowdown in percent before --baseline fails.")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                baseline = json.loads(Path(options['baseline']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read the baseline: {e}")
+
+        with benchmark_database():
+            seed(options['users'], options['genders'])
+            results = suite.run(options['iterations'], options['warmup'], options['scenarios'], options['warm_cache'])
+        report = {
+            'environment': suite.environment(
+                users=options['users'],
+                genders=options['genders'],
+                iterations=options['iterations'],
+                warm_cache=options['warm_cache'],
+            ),
+            'scenarios': results,
+        }
+
+        self.stdout.write('%-28s' % 'scenario' + ''.join('%10s' % column for column in COLUMNS))
+        for name, result in results.items():
+            self.stdout.write('%-28s' % name + ''.join('%10s' % result[column] for column in COLUMNS))
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Wrote {options['output']}.")
+        if baseline is not None:
+            self.report_comparison(suite.compare(results, baseline.get('scenarios', {}), options['threshold']))
+
+    def report_comparison(self, rows):
+        self.stdout.write('')
+        self.stdout.write('%-28s%12s%12s%10s%10s' % ('scenario', 'base p50', 'p50', 'change', 'queries'))
+        regressions = 0
+        for name, before, after, change, queries_before, queries_after, regressed in rows:
+            line = '%-28s%12s%12s%9s%%%10s' % (name, before, after, change, f'{queries_before}->{queries_after}')
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+            regressions += regressed
+        if regressions:
+            raise CommandError(f"{regressions} scenario(s) regressed against the baseline.")
@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from crud.benchmarks import asgi
+from crud.benchmarks.fixtures import benchmark_database, seed
+
+COLUMNS = ('requests', 'throughput', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync views behind the WSGI handler with the async views "
+        "behind the ASGI handler on a seeded throwaway database. Each "
+        "deployment runs in its own process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=['both', 'wsgi', 'asgi'], default='both')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=400, help="Directory fetches per scenario.")
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--json', action='store_true', help="Print the raw results as JSON.")
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'both':
+            results = {mode: self.run_child(mode, options) for mode in ('wsgi', 'asgi')}
+        else:
+            results = {options['mode']: self.run_here(options)}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for scenario in results[next(iter(results))]:
+            self.stdout.write(self.style.MIGRATE_HEADING(scenario))
+            self.stdout.write('  %-6s' % '' + ''.join('%12s' % column for column in COLUMNS))
+            for mode, report in results.items():
+                row = report.get(scenario, {})
+                self.stdout.write('  %-6s' % mode + ''.join('%12s' % row.get(column, '-') for column in COLUMNS))
+
+    def run_here(self, options):
+        if settings.CRUD_ASYNC_VIEWS != (options['mode'] == 'asgi'):
+            raise CommandError("Set CRUD_ASYNC_VIEWS=1 for the asgi mode and leave it unset for wsgi.")
+        with benchmark_database():
+            seed(options['users'])
+            return asgi.run(options['mode'], options['requests'], options['logins'], options['concurrency'])
+
+    def run_child(self, mode, options):
+        # The URLconf picks sync or async views at import time, hence one
+        # process per deployment.
+        env = dict(os.environ, CRUD_ASYNC_VIEWS='1' if mode == 'asgi' else '0')
+        command = [
+            sys.executable, '-m', 'django', 'benchmark_asgi', '--json',
+            '--mode', mode,
+            '--users', str(options['users']),
+            '--requests', str(options['requests']),
+            '--logins', str(options['logins']),
+            '--concurrency', str(options['concurrency']),
+        ]
+        self.stderr.write(f"Running the {mode} benchmark...")
+        result = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"The {mode} benchmark failed:\n{result.stderr}")
+        return json.loads(result.stdout)[mode]
@@ -0,0 +1,72 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from crud.benchmarks import concurrency
+from crud.benchmarks.fixtures import benchmark_database, seed
+
+COLUMNS = ('requests', 'errors', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure user_list read throughput while user_edit writes are in "
+        "flight, for each database profile in CRUD_DB_PROFILES. Each profile "
+        "runs in its own process on a fresh throwaway database file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', dest='profiles', help="Database profile, may be repeated. Defaults to all of them.")
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per profile.")
+        parser.add_argument('--json', action='store_true', help="Print the raw results as JSON.")
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(settings.CRUD_DB_PROFILES)
+        unknown = set(profiles) - set(settings.CRUD_DB_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown database profile(s): {', '.join(sorted(unknown))}.")
+
+        if profiles == [settings.CRUD_DB_PROFILE]:
+            results = {settings.CRUD_DB_PROFILE: self.run_here(options)}
+        else:
+            results = {profile: self.run_child(profile, options) for profile in profiles}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for kind in ('reads', 'writes'):
+            self.stdout.write(self.style.MIGRATE_HEADING(kind))
+            self.stdout.write('  %-12s' % '' + ''.join('%12s' % column for column in COLUMNS))
+            for profile, report in results.items():
+                row = report[kind]
+                self.stdout.write('  %-12s' % profile + ''.join('%12s' % row.get(column, '-') for column in COLUMNS))
+
+    def run_here(self, options):
+        with benchmark_database():
+            seed(options['users'])
+            return concurrency.run(options['readers'], options['writers'], options['duration'])
+
+    def run_child(self, profile, options):
+        # Profiles change DATABASES at settings import time, hence one
+        # process per profile.
+        env = dict(os.environ, CRUD_DB_PROFILE=profile)
+        command = [
+            sys.executable, '-m', 'django', 'benchmark_concurrency', '--json',
+            '--profile', profile,
+            '--users', str(options['users']),
+            '--readers', str(options['readers']),
+            '--writers', str(options['writers']),
+            '--duration', str(options['duration']),
+        ]
+        self.stderr.write(f"Running the {profile} profile...")
+        result = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"The {profile} benchmark failed:\n{result.stderr}")
+        return json.loads(result.stdout)[profile]
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from crud.benchmarks import throttle
+from crud.benchmarks.fixtures import benchmark_database, seed
+
+COLUMNS = ('requests', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+class Command(BaseCommand):
+    help = (
+        "Time legitimate sign-ins on a seeded throwaway database, alone, "
+        "under a wrong-password flood with the login throttle off, and under "
+        "the same flood with it on."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help="Seeded users.")
+        parser.add_argument('--clients', type=int, default=2, help="Threads signing in legitimately.")
+        parser.add_argument('--attackers', type=int, default=8, help="Threads posting wrong passwords.")
+        parser.add_argument('--attack-addresses', type=int, default=1, help="Client IPs the attack comes from.")
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds of legitimate sign-ins per phase.")
+        parser.add_argument('--warmup', type=float, default=10.0, help="Seconds the attack runs before legitimate sign-ins start.")
+        parser.add_argument('--json', action='store_true', help="Print the raw results as JSON.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed(options['users'])
+            results = throttle.run(options['clients'], options['attackers'], options['attack_addresses'], options['duration'], options['warmup'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for kind in ('legitimate', 'attack'):
+            self.stdout.write(self.style.MIGRATE_HEADING(kind))
+            self.stdout.write('  %-18s' % 'phase' + ''.join('%12s' % column for column in COLUMNS) + '  statuses')
+            for phase, report in results.items():
+                row = report[kind]
+                statuses = ', '.join(f'{status}: {count}' for status, count in sorted(row['statuses'].items()))
+                self.stdout.write('  %-18s' % phase + ''.join('%12s' % row.get(column, '-') for column in COLUMNS) + f'  {statuses}')
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from crud.benchmarks import render
+from crud.benchmarks.fixtures import benchmark_database, seed
+
+COLUMNS = ('p50_ms', 'p95_ms', 'mean_ms')
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the rendering of the list and form templates on a seeded "
+        "throwaway database, without the cached loader, with it, and with "
+        "fragment caching on top."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--genders', type=int, default=4)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help="Print the raw results as JSON.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            seed(options['users'], options['genders'])
+            results = render.run(options['iterations'], options['warmup'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for configuration, pages in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(configuration))
+            self.stdout.write('  %-16s' % 'page' + ''.join('%10s' % column for column in COLUMNS))
+            for name, result in pages.items():
+                self.stdout.write('  %-16s' % name + ''.join('%10s' % result[column] for column in COLUMNS))
+        self.stdout.write('')
+        self.stdout.write('%-16s%-26s%12s%10s%10s' % ('page', 'configuration', 'base p50', 'p50', 'saving'))
+        for name, configuration, before, after, change in render.savings(results):
+            self.stdout.write('%-16s%-26s%12s%10s%9s%%' % (name, configuration, before, after, change))
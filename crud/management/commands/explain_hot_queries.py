@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from crud.query_plans import hot_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the query plan of each hot query the crud views issue. With "
+        "--check, fail when one of them scans a table it should search."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help="Only explain these queries.")
+        parser.add_argument('--sql', action='store_true', help="Print the SQL as well.")
+        parser.add_argument('--check', action='store_true', help="Exit non-zero on an unexpected full table scan.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write(self.style.WARNING(f"Plans come from {connection.vendor}, the scan check expects SQLite's format."))
+        queries = [query for query in hot_queries() if not options['names'] or query.name in options['names']]
+        unknown = set(options['names']) - {query.name for query in queries}
+        if unknown:
+            raise CommandError(f"Unknown query name(s): {', '.join(sorted(unknown))}.")
+
+        failures = []
+        for query in queries:
+            plan = query.plan()
+            scans = query.full_scans(plan)
+            heading = self.style.ERROR(query.name) if scans else self.style.MIGRATE_HEADING(query.name)
+            self.stdout.write(heading)
+            if options['sql']:
+                self.stdout.write(f"  {query.queryset.query}")
+            for line in plan:
+                self.stdout.write(f"  {line}")
+            if scans:
+                failures.append(query.name)
+
+        if options['check'] and failures:
+            raise CommandError(f"Unexpected full table scan in: {', '.join(failures)}.")
+        self.stdout.write(self.style.SUCCESS(f"Explained {len(queries)} queries, {len(failures)} with unexpected scans."))
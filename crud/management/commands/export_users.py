@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from crud.export import CHUNK_SIZE, export_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream the user directory as CSV or NDJSON without loading it into memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--search', default='', help="Same filter as the user list search box.")
+        parser.add_argument('--output', help="File to write to, defaults to stdout.")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = export_chunks(options['format'], options['search'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
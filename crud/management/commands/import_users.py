@@ -0,0 +1,194 @@
+import csv
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.core.validators import validate_email
+from django.db import transaction
+
+from crud import caching, search, stats
+from crud.genders import gender_registry
+from crud.models import Profile
+
+FIELDS = ('username', 'first_name', 'last_name', 'email', 'gender', 'address', 'date_of_birth', 'phone_number', 'password')
+
+
+def read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_ndjson(stream):
+    for line_number, line in enumerate(stream, 1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream users from a CSV or NDJSON file (or '-' for stdin) and create "
+        "them with their profiles in bulk, without per-row signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="Defaults to the file extension, csv for stdin.")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Processes used to hash passwords.")
+        parser.add_argument('--rejects', help="Write rejected rows with their reasons to this CSV file.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, do not write anything.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        reader = read_ndjson if file_format == 'ndjson' else read_csv
+
+        self.genders = {gender.name.lower(): gender for gender in gender_registry.all()}
+        self.username_validator = UnicodeUsernameValidator()
+        self.dry_run = options['dry_run']
+        self.rejected = []
+        # Usernames met so far in the file. Kept across chunks: a dry run
+        # writes nothing, so the database can't catch a repeat in a later chunk.
+        self.seen = set()
+        created = 0
+
+        executor = ProcessPoolExecutor(options['workers']) if options['workers'] > 1 else None
+        try:
+            for chunk in chunked(reader(stream), options['chunk_size']):
+                created += self.import_chunk(chunk, executor)
+                self.stdout.write(f"Imported {created} user(s), rejected {len(self.rejected)} row(s)...")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if stream is not sys.stdin:
+                stream.close()
+
+        if options['rejects']:
+            with open(options['rejects'], 'w', newline='', encoding='utf-8') as rejects:
+                writer = csv.writer(rejects)
+                writer.writerow(['line', 'username', 'reason'])
+                writer.writerows(self.rejected)
+        for line_number, username, reason in self.rejected[:20]:
+            self.stderr.write(f"line {line_number} ({username or '-'}): {reason}")
+        if len(self.rejected) > 20:
+            self.stderr.write(f"... and {len(self.rejected) - 20} more rejected row(s).")
+        verb = "Validated" if self.dry_run else "Created"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {created} user(s), rejected {len(self.rejected)} row(s)."))
+
+    def clean_row(self, row):
+        if not isinstance(row, dict):
+            raise ValidationError("Malformed row.")
+        data = {field: ('' if row.get(field) is None else str(row.get(field))).strip() for field in FIELDS}
+        if not data['username']:
+            raise ValidationError("Username is required.")
+        self.username_validator(data['username'])
+        if len(data['username']) > 150:
+            raise ValidationError("Username is too long.")
+        if not data['first_name'] or not data['last_name']:
+            raise ValidationError("Full Name fields (First and Last) are required.")
+        if data['email']:
+            validate_email(data['email'])
+        gender = None
+        if data['gender']:
+            gender = self.genders.get(data['gender'].lower())
+            if gender is None:
+                raise ValidationError(f"Unknown gender {data['gender']!r}.")
+        date_of_birth = None
+        if data['date_of_birth']:
+            try:
+                date_of_birth = datetime.date.fromisoformat(data['date_of_birth'])
+            except ValueError:
+                raise ValidationError("Date of birth must be YYYY-MM-DD.")
+        phone_number = None
+        if data['phone_number']:
+            try:
+                phone_number = int(data['phone_number'])
+            except ValueError:
+                raise ValidationError("Phone number must be a number.")
+        user = User(
+            username=data['username'],
+            first_name=data['first_name'][:150],
+            last_name=data['last_name'][:150],
+            email=data['email'],
+        )
+        profile = Profile(gender=gender, address=data['address'][:255] or None, date_of_birth=date_of_birth, phone_number=phone_number)
+        return user, profile, data['password']
+
+    def import_chunk(self, chunk, executor):
+        valid = []
+        for line_number, row in chunk:
+            try:
+                user, profile, password = self.clean_row(row)
+                if user.username in self.seen:
+                    raise ValidationError("Duplicate username in file.")
+            except ValidationError as e:
+                username = row.get('username') if isinstance(row, dict) else None
+                self.rejected.append((line_number, username, ' '.join(e.messages)))
+                continue
+            self.seen.add(user.username)
+            valid.append((line_number, user, profile, password))
+
+        # One query per chunk for usernames that already exist.
+        existing = set(User.objects.filter(username__in=[item[1].username for item in valid]).values_list('username', flat=True))
+        if existing:
+            for line_number, user, profile, password in valid:
+                if user.username in existing:
+                    self.rejected.append((line_number, user.username, "Username already exists."))
+            valid = [item for item in valid if item[1].username not in existing]
+        if not valid or self.dry_run:
+            return len(valid)
+
+        passwords = [password or None for _, _, _, password in valid]
+        if executor is not None:
+            hashes = list(executor.map(make_password, passwords, chunksize=max(1, len(passwords) // 32)))
+        else:
+            hashes = [make_password(password) for password in passwords]
+
+        users = []
+        for (_, user, _, _), password_hash in zip(valid, hashes):
+            user.password = password_hash
+            users.append(user)
+
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            if users[0].pk is None:
+                ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+                for user in users:
+                    user.pk = ids[user.username]
+            profiles = []
+            for user, (_, _, profile, _) in zip(users, valid):
+                profile.user = user
+                profiles.append(profile)
+            Profile.objects.bulk_create(profiles)
+            # bulk_create bypasses the post_save receivers, so do their work once per chunk.
+            search.index_users(users)
+            deltas = {}
+            for user, profile in zip(users, profiles):
+                stats.merge(deltas, stats.user_deltas(user))
+                stats.merge(deltas, stats.profile_deltas(profile.gender_id, profile.date_of_birth))
+            stats.apply(deltas)
+        caching.bump_version(caching.DIRECTORY)
+        return len(users)
@@ -0,0 +1,21 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from crud.bulk import PURGE_CHUNK_SIZE, purge_deleted_users
+
+
+class Command(BaseCommand):
+    help = "Hard-delete soft-deleted users in small batches, each in its own short transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=getattr(settings, 'CRUD_PURGE_DELETED_USERS_AFTER', 30), help="Only purge users deleted at least this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=PURGE_CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        deleted_before = timezone.now() - datetime.timedelta(days=options['days'])
+        purged = purge_deleted_users(deleted_before, options['batch_size'], options['pause'])
+        self.stdout.write(f"Purged {purged} user(s) deleted before {deleted_before:%Y-%m-%d %H:%M}.")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from crud import stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the directory statistics summary table from auth_user and "
+        "crud_profile, e.g. after writes that bypassed the model signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        counts = stats.rebuild(options['database'])
+        self.stdout.write(f"Counted {counts[(stats.USERS, '')]} users into {sum(1 for count in counts.values() if count)} summary rows.")
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crud.gender_jobs import CHUNK_SIZE, run_pending
+from crud.models import GenderReassignment
+
+
+class Command(BaseCommand):
+    help = "Move the profiles of deleted or merged genders in chunks, then delete the genders."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between chunks, well below gender_jobs.STALE_AFTER.")
+        parser.add_argument('--retry-failed', action='store_true', help="Queue failed jobs again before running.")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new jobs instead of exiting once drained.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to sleep between polls with --loop.")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            GenderReassignment.objects.filter(status=GenderReassignment.FAILED).update(status=GenderReassignment.PENDING, last_error='')
+        while True:
+            for job in run_pending(options['chunk_size'], options['pause']):
+                line = f"{job.gender_name}: moved {job.processed} profile(s), {job.status}."
+                self.stdout.write(self.style.ERROR(f"{line} {job.last_error}") if job.status == GenderReassignment.FAILED else line)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
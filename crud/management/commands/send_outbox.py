@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from crud.outbox import BATCH_SIZE, MAX_ATTEMPTS, deliver_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox email in batches over one reused connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new messages instead of exiting once drained.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to sleep between polls with --loop.")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_batch(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(f"Sent {total_sent} message(s), {total_failed} failed attempt(s).")
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import QueryTimer, metrics_registry
+from .profiling import PROFILE_FLAG, profile_view
+
+
+class RequestMetricsMiddleware:
+    # Records wall time, query count and query time per resolved URL name.
+    # When CRUD_METRICS_ENABLED is off Django drops it from the chain at
+    # startup, so it costs nothing. Sync and async capable, so an ASGI
+    # server doesn't pay for a thread hop on every request.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CRUD_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self.time_queries(stack, timer)
+            response = self.get_response(request)
+        self.observe(request, start, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        # Connections belong to threads, and queries made while serving the
+        # request run in its thread-sensitive sync thread, so hook them there.
+        stack = ExitStack()
+        await sync_to_async(self.time_queries)(stack, timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.observe(request, start, timer)
+        return response
+
+    def time_queries(self, stack, timer):
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(timer))
+
+    def observe(self, request, start, timer):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match is not None else '<unresolved>'
+        metrics_registry.observe(view, duration, timer.count, timer.duration)
+
+
+class RequestProfilerMiddleware:
+    # ?_profile=1 on a crud view, from a superuser, runs the view under
+    # cProfile and saves the report with its SQL to the profile ring. Listed
+    # last so sessions, auth and CSRF have already run.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CRUD_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if PROFILE_FLAG not in request.GET or not view_func.__module__.startswith('crud.'):
+            return None
+        # cProfile only sees the calling thread, so coroutine views are left alone.
+        if asyncio.iscoroutinefunction(view_func) or not request.user.is_superuser:
+            return None
+        response, name = profile_view(request, view_func, view_args, view_kwargs)
+        response['X-Profile'] = name
+        return response
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.db import OperationalError, migrations
+
+SEARCH_FIELDS = 'username, first_name, last_name, email'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE crud_user_search USING fts5(%s, tokenize = "unicode61 remove_diacritics 2")'
+                % SEARCH_FIELDS
+            )
+        except OperationalError:
+            # SQLite built without FTS5, user_list keeps using LIKE filters.
+            return
+        cursor.execute(
+            'INSERT INTO crud_user_search (rowid, %s) SELECT id, %s FROM %s'
+            % (SEARCH_FIELDS, SEARCH_FIELDS, User._meta.db_table)
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS crud_user_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('crud', '0008_profile_phone_number'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
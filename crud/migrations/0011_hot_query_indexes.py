@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# auth_user belongs to django.contrib.auth, so its indexes are plain SQL.
+# lower() indexes serve case-insensitive lookups written as LOWER(col) = %s,
+# such as crud.passwords.resolve_user, the plain email index exact matches.
+INDEXES = [
+    ('crud_auth_user_email_idx', 'auth_user (email)'),
+    ('crud_auth_user_lower_email_idx', 'auth_user (lower(email))'),
+    ('crud_auth_user_lower_username_idx', 'auth_user (lower(username))'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('crud', '0010_outboxemail'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='CREATE INDEX IF NOT EXISTS %s ON %s' % (name, columns),
+            reverse_sql='DROP INDEX IF EXISTS %s' % name,
+        )
+        for name, columns in INDEXES
+    ]
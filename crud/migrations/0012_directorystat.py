@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:46
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import ExtractYear, TruncMonth
+from django.utils import timezone
+
+
+def count_existing_users(apps, schema_editor):
+    # A frozen copy of crud.stats.recount() at the time of this migration,
+    # over the historical models, so later changes to it can't break it.
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('crud', 'Profile')
+    DirectoryStat = apps.get_model('crud', 'DirectoryStat')
+    using = schema_editor.connection.alias
+    users = User.objects.using(using)
+    profiles = Profile.objects.using(using)
+    counts = Counter()
+    counts[('users', '')] = users.count()
+    for month, count in users.annotate(month=TruncMonth('date_joined')).values('month').annotate(n=Count('id')).values_list('month', 'n'):
+        if timezone.is_aware(month):
+            month = timezone.localtime(month)
+        counts[('signups', month.strftime('%Y-%m'))] += count
+    for gender_id, count in profiles.values('gender_id').annotate(n=Count('id')).values_list('gender_id', 'n'):
+        counts[('gender', str(gender_id) if gender_id else '')] += count
+    for year, count in profiles.annotate(year=ExtractYear('date_of_birth')).values('year').annotate(n=Count('id')).values_list('year', 'n'):
+        counts[('birth_year', str(year) if year else '')] += count
+    DirectoryStat.objects.using(using).bulk_create([
+        DirectoryStat(kind=kind, bucket=bucket, count=count) for (kind, bucket), count in counts.items() if count
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('crud', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectoryStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20)),
+                ('bucket', models.CharField(blank=True, max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='directorystat',
+            constraint=models.UniqueConstraint(fields=('kind', 'bucket'), name='crud_directorystat_kind_bucket'),
+        ),
+        migrations.RunPython(count_existing_users, migrations.RunPython.noop),
+    ]
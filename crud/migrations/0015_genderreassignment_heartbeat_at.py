@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crud', '0014_profile_deleted_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='genderreassignment',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations
+
+# No query filters on LOWER(username): logins and resolve_user match the
+# username exactly, against its unique index. The index only cost writes.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crud', '0015_genderreassignment_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql='DROP INDEX IF EXISTS crud_auth_user_lower_username_idx',
+            reverse_sql='CREATE INDEX IF NOT EXISTS crud_auth_user_lower_username_idx ON auth_user (lower(username))',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crud', '0016_drop_lower_username_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='was_active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
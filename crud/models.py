@@ -3,13 +3,18 @@ from django.contrib.auth.models import User
 
 class Gender(models.Model):
     name = models.CharField(max_length=50, unique=True)
+    # Cleared as soon as the gender is queued for removal, which hides it
+    # from forms and lists while a GenderReassignment moves its profiles.
+    is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return self.name
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import User
+from . import caching, search
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -17,21 +22,213 @@ class Profile(models.Model):
     address = models.CharField(max_length=255, blank=True, null=True)
     date_of_birth = models.DateField(blank=True, null=True)
     phone_number = models.IntegerField(blank=True, null=True)
+    # Set when the user is soft-deleted, see crud.bulk.soft_delete_users.
+    deleted_at = models.DateTimeField(blank=True, null=True)
+    # The user's is_active when they were soft-deleted, put back on restore.
+    was_active = models.BooleanField(default=True)
+
+    TRACKED_FIELDS = ('gender', 'address', 'date_of_birth', 'phone_number')
+
+    class Meta:
+        indexes = [
+            # Only the few soft-deleted rows, for the purge and restore pages.
+            models.Index(fields=['deleted_at'], name='crud_profile_deleted_at', condition=models.Q(deleted_at__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.user.username} Profile"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def get_dirty_fields(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return list(self.TRACKED_FIELDS)
+        dirty = []
+        for name in self.TRACKED_FIELDS:
+            attname = self._meta.get_field(name).attname
+            if attname not in loaded or getattr(self, attname) != loaded[attname]:
+                dirty.append(name)
+        return dirty
+
+    def save_changes(self):
+        # INSERT a new profile, otherwise UPDATE only the fields that changed
+        # since it was loaded, or nothing at all.
+        if self._state.adding:
+            self.save()
+            return True
+        dirty = self.get_dirty_fields()
+        if dirty:
+            self.save(update_fields=dirty)
+        return bool(dirty)
+
+class OutboxEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='crud_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.recipients}"
+
+class GenderReassignment(models.Model):
+    # Background job moving every profile of a removed gender to `target`
+    # (or to no gender) in chunks, then deleting the gender. Run by the
+    # run_gender_jobs command.
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    gender = models.ForeignKey(Gender, null=True, on_delete=models.SET_NULL, related_name='+')
+    gender_name = models.CharField(max_length=50)
+    target = models.ForeignKey(Gender, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Refreshed by the worker after every chunk, see gender_jobs.STALE_AFTER.
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.gender_name} -> {self.target or 'no gender'} ({self.status})"
+
+    @property
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        return min(100, self.processed * 100 // self.total) if self.total else 0
+
+class DirectoryStat(models.Model):
+    # One pre-aggregated count per (kind, bucket), kept current by crud.stats.
+    kind = models.CharField(max_length=20)
+    bucket = models.CharField(max_length=20, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'bucket'], name='crud_directorystat_kind_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.bucket}: {self.count}"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
+    # Views attach a filled-in, unsaved profile before saving a new user so
+    # its row is written once, complete.
     if created:
-        Profile.objects.create(user=instance)
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    try:
-        instance.profile.save()
-    except Profile.DoesNotExist:
-        Profile.objects.create(user=instance)
+        if User.profile.is_cached(instance):
+            instance.profile.save()
+        else:
+            Profile.objects.create(user=instance)
 from django.db import models
 from django.contrib.auth.models import User
 
+@receiver(post_save, sender=User)
+def index_user_for_search(sender, instance, using, update_fields, **kwargs):
+    # login() only touches last_login, which is not searchable.
+    if update_fields is not None and not set(update_fields) & set(search.SEARCH_FIELDS):
+        return
+    search.index_user(instance, using)
+
+@receiver(post_delete, sender=User)
+def unindex_user_for_search(sender, instance, using, **kwargs):
+    search.unindex_users([instance.pk], using)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_directory_version_for_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(search.SEARCH_FIELDS):
+        return
+    caching.bump_version(caching.DIRECTORY)
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def bump_directory_version_for_profile(sender, instance, **kwargs):
+    caching.bump_version(caching.DIRECTORY)
+
+@receiver(post_save, sender=Gender)
+@receiver(post_delete, sender=Gender)
+def bump_gender_version(sender, instance, **kwargs):
+    caching.bump_version(caching.DIRECTORY, caching.GENDERS)
+
+from . import stats
+
+@receiver(post_save, sender=User)
+def count_user(sender, instance, created, using, **kwargs):
+    if created:
+        stats.apply(stats.user_deltas(instance), using)
+
+@receiver(post_delete, sender=User)
+def uncount_user(sender, instance, using, **kwargs):
+    stats.apply(stats.user_deltas(instance, -1), using)
+
+@receiver(pre_save, sender=Profile)
+def load_counted_profile_fields(sender, instance, using, **kwargs):
+    # Saving a profile that was never loaded: fetch what it replaces.
+    if instance.pk is not None and getattr(instance, '_loaded_values', None) is None:
+        instance._loaded_values = Profile.objects.using(using).filter(pk=instance.pk).values('gender_id', 'date_of_birth').first() or {}
+
+@receiver(post_save, sender=Profile)
+def count_profile(sender, instance, created, using, update_fields, **kwargs):
+    # post_save runs before Profile.save() refreshes _loaded_values, so they
+    # still hold the replaced row.
+    if created:
+        stats.apply(stats.profile_deltas(instance.gender_id, instance.date_of_birth), using)
+        return
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    old, new = {}, {}
+    for attname in ('gender_id', 'date_of_birth'):
+        old[attname] = loaded.get(attname, getattr(instance, attname))
+        saved = update_fields is None or attname in update_fields or attname.removesuffix('_id') in update_fields
+        new[attname] = getattr(instance, attname) if saved else old[attname]
+    if old != new:
+        deltas = stats.profile_deltas(old['gender_id'], old['date_of_birth'], -1)
+        stats.merge(deltas, stats.profile_deltas(new['gender_id'], new['date_of_birth']))
+        stats.apply(deltas, using)
+
+@receiver(post_delete, sender=Profile)
+def uncount_profile(sender, instance, using, **kwargs):
+    stats.apply(stats.profile_deltas(instance.gender_id, instance.date_of_birth, -1), using)
+
+@receiver(post_delete, sender=Gender)
+def uncount_gender(sender, instance, using, **kwargs):
+    # Its profiles were switched to no gender by an UPDATE, without signals.
+    stats.move_gender(instance.pk, None, using)
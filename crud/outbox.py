@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 30
+# How long a claimed message is hidden from other workers. A worker that dies
+# mid-batch leaves its messages to be picked up again once it runs out.
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def enqueue_mail(subject, message, from_email, recipient_list):
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email,
+        recipients=','.join(recipient_list),
+    )
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=RETRY_BASE_DELAY * 2 ** (attempts - 1))
+
+
+def schedule_retry(email, error, now, max_attempts):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = OutboxEmail.FAILED
+    else:
+        email.next_attempt_at = now + retry_delay(email.attempts)
+
+
+def claim_batch(batch_size, now):
+    # Due messages, each pushed past the lease with a conditional UPDATE so two
+    # workers running send_outbox never send the same one.
+    due = OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+    emails = []
+    for email in due.order_by('next_attempt_at', 'id')[:batch_size]:
+        if due.filter(pk=email.pk).update(next_attempt_at=now + CLAIM_LEASE):
+            email.next_attempt_at = now + CLAIM_LEASE
+            emails.append(email)
+    return emails
+
+
+def deliver_batch(batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS, connection=None):
+    # Sends one batch of due messages over a single backend connection and
+    # returns (sent, failed) counts for the batch.
+    now = timezone.now()
+    emails = claim_batch(batch_size, now)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = connection or get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        # The server is unreachable, every message in the batch backs off.
+        for email in emails:
+            schedule_retry(email, e, now, max_attempts)
+        OutboxEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+        return 0, len(emails)
+    try:
+        for email in emails:
+            message = EmailMessage(
+                email.subject, email.body, email.from_email, email.recipients.split(','), connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                schedule_retry(email, e, now, max_attempts)
+            else:
+                sent += 1
+                email.attempts += 1
+                email.status = OutboxEmail.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+    finally:
+        connection.close()
+
+    OutboxEmail.objects.bulk_update(emails, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
@@ -0,0 +1,65 @@
+import secrets
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Lower
+
+from .caching import get_shared_cache
+
+# Seconds a confirmed-but-not-yet-applied password change stays valid.
+PASSWORD_CHANGE_TIMEOUT = 60 * 5
+
+SESSION_KEY = 'change_password_token'
+
+# Longest identifier worth looking up, auth_user.email's max_length.
+IDENTIFIER_MAX_LENGTH = 254
+
+
+def _cache_key(token):
+    return 'crud:password-change:%s' % token
+
+
+def stash_password_change(request, new_password):
+    # Between the form and the confirm step the session holds only a random
+    # token. The hashed password waits in the shared cache under that token,
+    # so any worker can confirm it, and expires on its own.
+    token = secrets.token_urlsafe(16)
+    get_shared_cache().set(_cache_key(token), (request.user.pk, make_password(new_password)), PASSWORD_CHANGE_TIMEOUT)
+    request.session[SESSION_KEY] = token
+
+
+def pop_password_change(request):
+    # The stashed password hash for this user, or None once it expired.
+    token = request.session.pop(SESSION_KEY, None)
+    if token is None:
+        return None
+    cache = get_shared_cache()
+    stashed = cache.get(_cache_key(token))
+    cache.delete(_cache_key(token))
+    if stashed is None or stashed[0] != request.user.pk:
+        return None
+    return stashed[1]
+
+
+def user_lookup(identifier):
+    # Active users whose username is identifier or whose email matches it
+    # case-insensitively, the username match first. Served by the username
+    # unique index and crud_auth_user_lower_email_idx.
+    match = Q(username=identifier)
+    if '@' in identifier:
+        match |= Q(email_lower=Lower(Value(identifier)))
+    return (
+        User.objects.annotate(email_lower=Lower('email'))
+        .filter(match, is_active=True)
+        .order_by(Case(When(username=identifier, then=0), default=1), 'pk')
+    )
+
+
+def resolve_user(identifier):
+    # One query at most. Blank or overlong identifiers never reach the
+    # database, and ones without an @ only look at usernames.
+    identifier = (identifier or '').strip()
+    if not identifier or len(identifier) > IDENTIFIER_MAX_LENGTH:
+        return None
+    return user_lookup(identifier).first()
@@ -0,0 +1,113 @@
+import cProfile
+import io
+import json
+import pstats
+import re
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+PROFILE_FLAG = '_profile'
+
+# Functions kept in each saved report, by cumulative time.
+STATS_LIMIT = 60
+
+NAME_RE = re.compile(r'^\d{20}-[\w.-]+\.json$')
+
+
+def profile_dir():
+    return Path(getattr(settings, 'CRUD_PROFILE_DIR', settings.BASE_DIR / 'profiles'))
+
+
+class QueryLog:
+    # connection.execute_wrapper() hook keeping every statement and its time.
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql,
+                'params': repr(params)[:500],
+                'many': many,
+                'time_ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+def profile_view(request, view_func, view_args, view_kwargs):
+    profiler = cProfile.Profile()
+    log = QueryLog()
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(log))
+        response = profiler.runcall(view_func, request, *view_args, **view_kwargs)
+        # Render lazy responses inside the profile, that is where templates run.
+        if hasattr(response, 'render') and callable(response.render):
+            response = profiler.runcall(response.render)
+    duration = time.perf_counter() - start
+
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(STATS_LIMIT)
+    record = {
+        'view': request.resolver_match.view_name,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'user': request.user.get_username(),
+        'status': response.status_code,
+        'created': timezone.now().isoformat(),
+        'duration_ms': round(duration * 1000, 3),
+        'query_count': len(log.queries),
+        'query_time_ms': round(sum(query['time_ms'] for query in log.queries), 3),
+        'queries': log.queries,
+        'stats': report.getvalue(),
+    }
+    return response, save_profile(record)
+
+
+def save_profile(record):
+    # A bounded ring: the name sorts by time, the oldest files beyond
+    # CRUD_PROFILE_KEEP are removed after every write.
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = '%020d-%s.json' % (time.time_ns(), re.sub(r'[^\w.-]', '_', record['view']))
+    (directory / name).write_text(json.dumps(record, indent=2))
+    keep = getattr(settings, 'CRUD_PROFILE_KEEP', 50)
+    for old in profile_names()[keep:]:
+        (directory / old).unlink(missing_ok=True)
+    return name
+
+
+def profile_names():
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    return sorted((path.name for path in directory.iterdir() if NAME_RE.match(path.name)), reverse=True)
+
+
+def load_profile(name):
+    if not NAME_RE.match(name):
+        return None
+    try:
+        return json.loads((profile_dir() / name).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def recent_profiles():
+    profiles = []
+    for name in profile_names():
+        record = load_profile(name)
+        if record is not None:
+            record.pop('stats', None)
+            record.pop('queries', None)
+            record['name'] = name
+            profiles.append(record)
+    return profiles
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from .directory import filter_users, keyset_slice
+from .models import Gender, OutboxEmail, Profile
+from .passwords import user_lookup
+
+
+class HotQuery:
+    # allowed_scans names the tables this query may legitimately read in
+    # full, e.g. the unfiltered first page that stops after LIMIT rows.
+    def __init__(self, name, queryset, allowed_scans=()):
+        self.name = name
+        self.queryset = queryset
+        self.allowed_scans = set(allowed_scans)
+
+    def plan(self):
+        return self.queryset.explain().splitlines()
+
+    def full_scans(self, plan=None):
+        scans = []
+        for line in plan if plan is not None else self.plan():
+            # SQLite plan rows read "<id> <parent> <unused> SCAN <table> ...".
+            words = line.split()
+            if 'SCAN' in words[:-1] and words[words.index('SCAN') + 1] not in self.allowed_scans:
+                scans.append(line.strip())
+        return scans
+
+
+def hot_queries():
+    # Mirrors the queries the views issue, with placeholder values.
+    now = timezone.now()
+    users = filter_users()
+    searched = filter_users('smith')
+    return [
+        HotQuery('directory_first_page', keyset_slice(users), allowed_scans=['auth_user']),
+        HotQuery('directory_after_cursor', keyset_slice(users, after=1000)),
+        HotQuery('directory_before_cursor', keyset_slice(users, before=1000)),
+        HotQuery('directory_count', users, allowed_scans=['auth_user']),
+        HotQuery('directory_search', keyset_slice(searched), allowed_scans=['crud_user_search']),
+        HotQuery('directory_search_count', searched, allowed_scans=['crud_user_search']),
+        HotQuery('user_by_id', User.objects.filter(pk=1)),
+        HotQuery('user_by_username', User.objects.filter(username='someone')),
+        HotQuery('user_by_email', User.objects.filter(email='someone@example.com')),
+        HotQuery('user_by_lower_email', User.objects.annotate(email_lower=Lower('email')).filter(email_lower='someone@example.com')),
+        HotQuery('resolve_user', user_lookup('someone@example.com')[:1]),
+        HotQuery('session', Session.objects.filter(session_key='x' * 32, expire_date__gt=now)),
+        HotQuery('genders', Gender.objects.order_by('id'), allowed_scans=['crud_gender']),
+        HotQuery('deleted_users', Profile.objects.filter(deleted_at__isnull=False).order_by('-deleted_at')[:10]),
+        HotQuery('purge_due', Profile.objects.filter(deleted_at__lt=now).order_by('deleted_at', 'user_id').values_list('user_id')[:100]),
+        HotQuery('outbox_due', OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now).order_by('next_attempt_at', 'id')[:50]),
+    ]
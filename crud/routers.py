@@ -0,0 +1,84 @@
+import asyncio
+from contextvars import ContextVar
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+# Signed browser-session cookie set by the first write, from then on the
+# client's reads stay on the primary so it always sees what it wrote. A
+# cookie rather than a session key, so pinning costs no database write.
+PIN_COOKIE = 'crud_pin_primary'
+
+_replica_reads = ContextVar('crud_replica_reads', default=False)
+
+
+def replica_available():
+    if REPLICA_ALIAS not in connections.settings:
+        return False
+    # Under the test runner the replica is a MIRROR sharing the primary's
+    # database, and has to read through the primary to see the test's
+    # transaction.
+    return connections[REPLICA_ALIAS].settings_dict['NAME'] != connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+
+
+class ReadReplicaRouter:
+    # Reads go to the read-only alias only inside a replica_reads view,
+    # every write goes to the primary.
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and replica_available():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, REPLICA_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA_ALIAS:
+            return False
+        return None
+
+
+def is_pinned(request):
+    return request.get_signed_cookie(PIN_COOKIE, default=None) is not None
+
+
+def replica_reads(view_func):
+    # Apply below login_required, so the session and user are loaded from
+    # the primary before reads switch over.
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _replica_reads.set(not is_pinned(request))
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        token = _replica_reads.set(not is_pinned(request))
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+def pins_primary(view_func):
+    # For views that write on POST: pin the client to the primary.
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        response = view_func(request, *args, **kwargs)
+        if request.method == 'POST' and not is_pinned(request):
+            response.set_signed_cookie(PIN_COOKIE, '1', httponly=True, samesite='Lax')
+        return response
+    return wrapper
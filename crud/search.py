@@ -0,0 +1,107 @@
+import re
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'crud_user_search'
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+# unicode61 splits on anything that is not a letter or digit, underscores
+# included, so queries are tokenized the same way.
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+_deferred = threading.local()
+
+
+def fts_available(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    known = connection.__dict__.setdefault('_crud_fts_available', {})
+    if name not in known:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+            known[name] = cursor.fetchone() is not None
+    return known[name]
+
+
+def build_match(search_query):
+    # Every token has to match the start of a token in some column.
+    return ' '.join('"%s"*' % token for token in TOKEN_RE.findall(search_query))
+
+
+def search_users(users, search_query):
+    match = build_match(search_query)
+    if match and fts_available(users.db):
+        return users.filter(id__in=RawSQL(
+            'SELECT rowid FROM %s WHERE %s MATCH %%s' % (FTS_TABLE, FTS_TABLE), (match,)
+        ))
+    return users.filter(
+        Q(username__icontains=search_query) |
+        Q(first_name__icontains=search_query) |
+        Q(last_name__icontains=search_query) |
+        Q(email__icontains=search_query)
+    )
+
+
+def index_users(users, using='default'):
+    if not fts_available(using):
+        return
+    rows = [[user.pk] + [getattr(user, field) for field in SEARCH_FIELDS] for user in users]
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            'INSERT OR REPLACE INTO %s (rowid, %s) VALUES (%%s, %%s, %%s, %%s, %%s)' % (FTS_TABLE, ', '.join(SEARCH_FIELDS)),
+            rows,
+        )
+
+
+def index_user(user, using='default'):
+    index_users([user], using)
+
+
+def unindex_users(user_ids, using='default'):
+    pending = getattr(_deferred, 'user_ids', None)
+    if pending is not None:
+        pending.update(user_ids)
+        return
+    if not user_ids or not fts_available(using):
+        return
+    user_ids = list(user_ids)
+    with connections[using].cursor() as cursor:
+        for start in range(0, len(user_ids), 500):
+            batch = user_ids[start:start + 500]
+            cursor.execute(
+                'DELETE FROM %s WHERE rowid IN (%s)' % (FTS_TABLE, ', '.join(['%s'] * len(batch))), batch
+            )
+
+
+@contextmanager
+def deferred_unindex(using='default'):
+    # Collect the per-row post_delete unindexing of a bulk delete into one
+    # statement, run only if the block completes. Nested blocks leave it to
+    # the outermost one.
+    if getattr(_deferred, 'user_ids', None) is not None:
+        yield
+        return
+    _deferred.user_ids = set()
+    try:
+        yield
+    except BaseException:
+        _deferred.user_ids = None
+        raise
+    user_ids, _deferred.user_ids = _deferred.user_ids, None
+    unindex_users(user_ids, using)
+
+
+def rebuild_index(using='default'):
+    if not fts_available(using):
+        return
+    columns = ', '.join(SEARCH_FIELDS)
+    with connections[using].cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        cursor.execute('INSERT INTO %s (rowid, %s) SELECT id, %s FROM %s' % (FTS_TABLE, columns, columns, User._meta.db_table))
@@ -0,0 +1,176 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.db.models import Count
+from django.db.models.functions import ExtractYear, TruncMonth
+from django.utils import timezone
+
+from .genders import gender_registry
+from .models import DirectoryStat, Profile
+
+# DirectoryStat kinds. Buckets: '' for USERS, the gender id or '' for no
+# gender, the birth year or '' when unknown, and the signup month as YYYY-MM.
+USERS = 'users'
+GENDER = 'gender'
+BIRTH_YEAR = 'birth_year'
+SIGNUPS = 'signups'
+
+# Inclusive (low, high) ages, high None for open-ended. Ages are derived from
+# birth years when the dashboard is read, so the counters never go stale as
+# people get older, at the price of being off by up to a year.
+AGE_BUCKETS = ((0, 17), (18, 24), (25, 34), (35, 44), (45, 54), (55, 64), (65, None))
+
+_deferred = threading.local()
+
+
+def month_bucket(value):
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.strftime('%Y-%m')
+
+
+def user_deltas(user, sign=1):
+    return {(USERS, ''): sign, (SIGNUPS, month_bucket(user.date_joined)): sign}
+
+
+def profile_deltas(gender_id, date_of_birth, sign=1):
+    return {
+        (GENDER, str(gender_id) if gender_id else ''): sign,
+        (BIRTH_YEAR, str(date_of_birth.year) if date_of_birth else ''): sign,
+    }
+
+
+def merge(deltas, more):
+    for key, change in more.items():
+        deltas[key] = deltas.get(key, 0) + change
+    return deltas
+
+
+def apply(deltas, using='default'):
+    deltas = {key: change for key, change in deltas.items() if change}
+    if not deltas:
+        return
+    pending = getattr(_deferred, 'deltas', None)
+    if pending is not None:
+        merge(pending.setdefault(using, {}), deltas)
+        return
+    _write(deltas, using)
+
+
+def _write(deltas, using):
+    # Every change in one upsert.
+    table = DirectoryStat._meta.db_table
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO %s (kind, bucket, count) VALUES %s '
+            'ON CONFLICT (kind, bucket) DO UPDATE SET count = count + excluded.count'
+            % (table, ', '.join(['(%s, %s, %s)'] * len(deltas))),
+            [value for (kind, bucket), change in deltas.items() for value in (kind, bucket, change)],
+        )
+
+
+@contextmanager
+def deferred_counts():
+    # Collect the per-row signal updates of a bulk write into one upsert per
+    # database. Nothing is written if the block raises, so open it inside
+    # the write's transaction and the counters commit or roll back with it.
+    if getattr(_deferred, 'deltas', None) is not None:
+        yield
+        return
+    _deferred.deltas = {}
+    try:
+        yield
+    except BaseException:
+        _deferred.deltas = None
+        raise
+    pending, _deferred.deltas = _deferred.deltas, None
+    for using, deltas in pending.items():
+        apply(deltas, using)
+
+
+@contextmanager
+def discarded_counts():
+    # Drop the signal updates of deleting rows that are not counted any more,
+    # like purging soft-deleted users.
+    previous, _deferred.deltas = getattr(_deferred, 'deltas', None), {}
+    try:
+        yield
+    finally:
+        _deferred.deltas = previous
+
+
+def move_gender(old_gender_id, new_gender_id, using='default'):
+    count = DirectoryStat.objects.using(using).filter(kind=GENDER, bucket=str(old_gender_id)).values_list('count', flat=True).first()
+    if count:
+        apply({(GENDER, str(old_gender_id)): -count, (GENDER, str(new_gender_id) if new_gender_id else ''): count}, using)
+
+
+def recount(users, profiles):
+    # {(kind, bucket): count} with GROUP BY queries over the given querysets.
+    counts = Counter()
+    counts[(USERS, '')] = users.count()
+    for month, count in users.annotate(month=TruncMonth('date_joined')).values('month').annotate(n=Count('id')).values_list('month', 'n'):
+        counts[(SIGNUPS, month_bucket(month))] += count
+    for gender_id, count in profiles.values('gender_id').annotate(n=Count('id')).values_list('gender_id', 'n'):
+        counts[(GENDER, str(gender_id) if gender_id else '')] += count
+    for year, count in profiles.annotate(year=ExtractYear('date_of_birth')).values('year').annotate(n=Count('id')).values_list('year', 'n'):
+        counts[(BIRTH_YEAR, str(year) if year else '')] += count
+    return counts
+
+
+def rebuild(using='default'):
+    # Recount from scratch, for after writes that bypass the signals or to
+    # repair drift. Soft-deleted users are not counted.
+    counts = recount(
+        User.objects.using(using).filter(profile__deleted_at__isnull=True),
+        Profile.objects.using(using).filter(deleted_at__isnull=True),
+    )
+    with transaction.atomic(using=using):
+        DirectoryStat.objects.using(using).all().delete()
+        DirectoryStat.objects.using(using).bulk_create([
+            DirectoryStat(kind=kind, bucket=bucket, count=count) for (kind, bucket), count in counts.items() if count
+        ])
+    return counts
+
+
+def age_label(low, high):
+    return f'{low}+' if high is None else f'{low}-{high}'
+
+
+def summary(today=None):
+    # The whole dashboard from one read of the summary table, whose size
+    # depends on the number of genders, birth years and months, never users.
+    today = today or timezone.localdate()
+    rows = {}
+    for kind, bucket, count in DirectoryStat.objects.filter(count__gt=0).values_list('kind', 'bucket', 'count'):
+        rows.setdefault(kind, {})[bucket] = count
+
+    genders = []
+    gender_rows = dict(rows.get(GENDER, {}))
+    # Genders queued for removal too, until their profiles have moved.
+    for gender in gender_registry.mapping().values():
+        genders.append({'id': gender.pk, 'name': gender.name, 'count': gender_rows.pop(str(gender.pk), 0)})
+    genders.append({'id': None, 'name': 'Not specified', 'count': sum(gender_rows.values())})
+
+    ages = Counter()
+    for year, count in rows.get(BIRTH_YEAR, {}).items():
+        if not year:
+            ages['Unknown'] += count
+            continue
+        age = max(0, today.year - int(year))
+        for low, high in AGE_BUCKETS:
+            if age >= low and (high is None or age <= high):
+                ages[age_label(low, high)] += count
+                break
+    age_buckets = [{'label': age_label(low, high), 'count': ages[age_label(low, high)]} for low, high in AGE_BUCKETS]
+    age_buckets.append({'label': 'Unknown', 'count': ages['Unknown']})
+
+    return {
+        'users': rows.get(USERS, {}).get('', 0),
+        'genders': genders,
+        'age_buckets': age_buckets,
+        'signups': [{'month': month, 'count': count} for month, count in sorted(rows.get(SIGNUPS, {}).items())],
+    }
@@ -1,3 +1,1467 @@
-from django.test import TestCase
-
-# Create your tests here.
+import asyncio
+import datetime
+import json
+import tempfile
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models.signals import post_delete
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.urls import path, reverse
+from django.utils import timezone
+
+from . import async_views, bulk, caching, gender_jobs, outbox, routers, search, stats, throttling, urls
+from .benchmarks import render, suite
+from .benchmarks.fixtures import seed
+from .export import export_rows
+from .management.commands import import_users
+from .forms import GenderChoiceField
+from .genders import gender_registry
+from .metrics import metrics_registry
+from .middleware import RequestMetricsMiddleware
+from .passwords import resolve_user
+from .profiling import load_profile, profile_names
+from .query_plans import hot_queries
+from .models import DirectoryStat, Gender, GenderReassignment, OutboxEmail, Profile
+from .outbox import claim_batch, deliver_batch, enqueue_mail
+
+
+# The real 'shared' cache is a directory on disk, kept across runs and seen
+# by a running server. Give the tests a private in-memory one.
+shared_cache_for_tests = override_settings(CACHES={
+    **settings.CACHES,
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-shared'},
+})
+
+
+def setUpModule():
+    shared_cache_for_tests.enable()
+
+
+def tearDownModule():
+    shared_cache_for_tests.disable()
+
+
+class UserListQueryBudgetTests(TestCase):
+    # request.user + COUNT(*) + one joined page query, the session is cached
+    QUERY_BUDGET = 3
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.male = Gender.objects.create(name='Male')
+        # Gender names come from the process-wide registry, warm it up front.
+        gender_registry.all()
+
+    def make_users(self, count):
+        for i in range(count):
+            user = User.objects.create(username=f'user{i}', email=f'user{i}@example.com', first_name='First', last_name=f'Last{i}')
+            user.profile.gender = self.male
+            user.profile.address = f'{i} Main St'
+            user.profile.save()
+
+    def fetch(self, **params):
+        return self.client.get(reverse('user_list'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_xhr_page_with_single_row(self):
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.fetch()
+        self.assertEqual(len(response.json()['users']), 1)
+
+    def test_xhr_page_query_count_does_not_grow_with_rows(self):
+        self.make_users(25)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.fetch(page=2)
+        data = response.json()
+        self.assertEqual(len(data['users']), 10)
+        self.assertEqual(data['num_pages'], 3)
+        self.assertEqual(data['users'][0]['gender'], 'Male')
+
+    def test_xhr_search_query_count(self):
+        self.make_users(15)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.fetch(search='Last1')
+        self.assertEqual(len(response.json()['users']), 6)
+
+    def test_user_without_profile_serializes_blank_fields(self):
+        self.admin.profile.delete()
+        row = self.fetch().json()['users'][0]
+        self.assertEqual((row['gender'], row['address'], row['date_of_birth']), ('', '', ''))
+
+    def test_html_page_query_count(self):
+        # Only request.user: the HTML shell renders no rows and no page count,
+        # both arrive over XHR.
+        self.make_users(25)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user_list'))
+        self.assertEqual(response.status_code, 200)
+
+
+class UserListCursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        User.objects.bulk_create([User(username=f'user{i:02}') for i in range(24)])
+
+    def fetch(self, **params):
+        params['mode'] = 'cursor'
+        return self.client.get(reverse('user_list'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_walk_forward_and_back(self):
+        first = self.fetch(count=1).json()
+        self.assertEqual(first['total_count'], 25)
+        self.assertFalse(first['has_previous'])
+        second = self.fetch(after=first['next_cursor']).json()
+        third = self.fetch(after=second['next_cursor']).json()
+        self.assertEqual(len(third['users']), 5)
+        self.assertFalse(third['has_next'])
+        back = self.fetch(before=third['prev_cursor']).json()
+        self.assertEqual(back['users'], second['users'])
+        self.assertTrue(back['has_previous'])
+
+    def test_deep_page_skips_count(self):
+        first = self.fetch().json()
+        with self.assertNumQueries(2):
+            self.fetch(after=first['next_cursor'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.fetch(after='not-a-cursor').status_code, 400)
+
+
+class UserSearchIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.jane = User.objects.create(username='jane_doe', first_name='Jane', last_name='Doe', email='jane@corp.example')
+        User.objects.create(username='john', first_name='John', last_name='Smith', email='john@example.com')
+
+    def search(self, query):
+        response = self.client.get(reverse('user_list'), {'search': query}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        return [row['username'] for row in response.json()['users']]
+
+    def test_uses_fts_index(self):
+        self.assertTrue(search.fts_available())
+        self.assertEqual(search.build_match('jane d'), '"jane"* "d"*')
+
+    def test_prefix_and_token_matches(self):
+        self.assertEqual(self.search('ja do'), ['jane_doe'])
+        self.assertEqual(self.search('corp'), ['jane_doe'])
+        self.assertEqual(self.search('smi'), ['john'])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.jane.last_name = 'Roe'
+        self.jane.save()
+        self.assertEqual(self.search('roe'), ['jane_doe'])
+        self.jane.delete()
+        self.assertEqual(self.search('jane'), [])
+
+    def indexed_ids(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT rowid FROM %s' % search.FTS_TABLE)
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_deferred_unindex_nests_and_skips_failed_blocks(self):
+        john = User.objects.get(username='john')
+        with search.deferred_unindex():
+            john.delete()
+            with search.deferred_unindex():
+                self.jane.delete()
+        admin_id = self.admin.pk
+        self.assertEqual(self.indexed_ids(), {admin_id})
+
+        with self.assertRaises(RuntimeError), search.deferred_unindex(), transaction.atomic():
+            self.admin.delete()
+            raise RuntimeError('rolled back')
+        self.assertEqual(self.indexed_ids(), {admin_id})
+
+    def test_query_without_tokens_falls_back_to_like(self):
+        self.assertEqual(self.search('@corp.'), ['jane_doe'])
+
+
+class UserListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+
+    def fetch(self, **params):
+        return self.client.get(reverse('user_list'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def assert_cached_until_write(self):
+        self.fetch(mode='cursor')
+        # Only the request.user lookup remains on a hit.
+        with self.assertNumQueries(1):
+            self.fetch(mode='cursor')
+        gender = Gender.objects.create(name='Female')
+        self.admin.profile.gender = gender
+        self.admin.profile.save()
+        # The page query plus one reload of the gender registry.
+        with self.assertNumQueries(3):
+            response = self.fetch(mode='cursor')
+        self.assertEqual(response.json()['users'][0]['gender'], 'Female')
+        gender.name = 'Woman'
+        gender.save()
+        self.assertEqual(self.fetch(mode='cursor').json()['users'][0]['gender'], 'Woman')
+
+    def test_write_from_another_process_reaches_cached_pages(self):
+        self.assertEqual(len(self.fetch(mode='cursor').json()['users']), 1)
+        # import_users or a job worker, with a local cache of its own.
+        with self.settings(CRUD_CACHE_ALIAS='template_fragments'):
+            User.objects.create(username='imported')
+        self.assertEqual(len(self.fetch(mode='cursor').json()['users']), 2)
+
+    def test_locmem_backend(self):
+        self.assert_cached_until_write()
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches_setting = {
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+            }
+            with self.settings(CACHES=caches_setting, CRUD_CACHE_ALIAS='shared'):
+                self.assert_cached_until_write()
+
+    def test_deferred_bumps_collapse(self):
+        version = caching.get_version(caching.DIRECTORY)
+        with caching.deferred_bumps():
+            User.objects.create(username='a')
+            self.assertEqual(caching.get_version(caching.DIRECTORY), version)
+        self.assertNotEqual(caching.get_version(caching.DIRECTORY), version)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+
+    def test_user_list_xhr_not_modified(self):
+        url = reverse('user_list')
+        response = self.client.get(url, {'mode': 'cursor'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'mode': 'cursor'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        User.objects.create(username='new')
+        response = self.client.get(url, {'mode': 'cursor'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_list_html_etag_differs_from_xhr(self):
+        url = reverse('user_list')
+        html = self.client.get(url)
+        xhr = self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotEqual(html['ETag'], xhr['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=html['ETag']).status_code, 304)
+
+    def test_cached_user_list_posts_with_rotated_csrf_token(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        client.force_login(self.admin)
+        url = reverse('user_list')
+        response = client.get(url)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        etag = response['ETag']
+        old_token = client.cookies[settings.CSRF_COOKIE_NAME].value
+        client.logout()
+        client.get(reverse('login'))
+        client.post(reverse('login'), {'form_type': 'login', 'username': 'admin', 'password': 'secret', 'csrfmiddlewaretoken': client.cookies[settings.CSRF_COOKIE_NAME].value})
+        self.assertNotEqual(client.cookies[settings.CSRF_COOKIE_NAME].value, old_token)
+        # Still a 304, the browser keeps the page fetched with the old token.
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = client.post(reverse('user_bulk_action'), {'action': 'deactivate', 'ids': [self.admin.pk]}, HTTP_X_CSRFTOKEN=client.cookies[settings.CSRF_COOKIE_NAME].value)
+        self.assertEqual(response.status_code, 200)
+
+    def test_gender_list_not_modified_until_gender_changes(self):
+        url = reverse('gender_list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Gender.objects.create(name='Others')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etags_change_after_write_from_another_process(self):
+        users_url, genders_url = reverse('user_list'), reverse('gender_list')
+        users_etag = self.client.get(users_url)['ETag']
+        genders_etag = self.client.get(genders_url)['ETag']
+        # A worker with its own local cache does the writes.
+        with self.settings(CRUD_CACHE_ALIAS='template_fragments'):
+            User.objects.create(username='imported')
+            Gender.objects.create(name='Others')
+        self.assertEqual(self.client.get(users_url, HTTP_IF_NONE_MATCH=users_etag).status_code, 200)
+        self.assertEqual(self.client.get(genders_url, HTTP_IF_NONE_MATCH=genders_etag).status_code, 200)
+
+
+class AsyncURLConf:
+    # crud.urls as served under ASGI.
+    urlpatterns = [
+        path('login/', async_views.user_login, name='login'),
+        path('user/list/', async_views.user_list, name='user_list'),
+        path('gender/list/', async_views.gender_list, name='gender_list'),
+    ] + urls.urlpatterns
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.male = Gender.objects.create(name='Male')
+        self.admin.profile.gender = self.male
+        self.admin.profile.save()
+        for i in range(12):
+            User.objects.create(username=f'user{i}', first_name=f'First{i}', last_name='Last')
+
+    async def test_anonymous_redirected_to_login(self):
+        response = await self.async_client.get(reverse('user_list'))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
+
+    async def test_directory_matches_sync_view(self):
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        params = {'mode': 'cursor', 'search': 'First', 'count': '1'}
+        response = await self.async_client.get(reverse('user_list'), params, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_count'], 12)
+        self.assertEqual(len(data['users']), 10)
+        await sync_to_async(cache.clear)()
+        await sync_to_async(self.client.force_login)(self.admin)
+        with override_settings(ROOT_URLCONF='pinuelasite.urls'):
+            expected = await sync_to_async(self.client.get)(reverse('user_list'), params, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(data, expected.json())
+
+    async def test_directory_not_modified_and_bad_cursor(self):
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        headers = {'X-Requested-With': 'XMLHttpRequest'}
+        response = await self.async_client.get(reverse('user_list'), {'mode': 'cursor'}, headers=headers)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('X-Requested-With', response['Vary'])
+        headers['If-None-Match'] = response['ETag']
+        response = await self.async_client.get(reverse('user_list'), {'mode': 'cursor'}, headers=headers)
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse('user_list'), {'mode': 'cursor', 'after': '!!'}, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_cache_calls_stay_off_the_event_loop(self):
+        on_loop = []
+
+        def watch(method):
+            def wrapper(*args, **kwargs):
+                try:
+                    asyncio.get_running_loop()
+                    on_loop.append(method.__name__)
+                except RuntimeError:
+                    pass
+                return method(*args, **kwargs)
+            return wrapper
+
+        crud_cache = caching.get_cache()
+        with mock.patch.multiple(crud_cache, get=watch(crud_cache.get), set=watch(crud_cache.set), add=watch(crud_cache.add)):
+            await sync_to_async(gender_registry.clear)()
+            self.assertEqual([gender.name for gender in await gender_registry.aall()], ['Male'])
+            data = json.loads(await async_views.acached_directory_json({'mode': 'cursor', 'count': '1'}))
+            self.assertEqual(data['total_count'], 13)
+            await async_views.acached_directory_json({'mode': 'cursor', 'count': '1'})
+        self.assertEqual(on_loop, [])
+
+    async def test_html_and_gender_list(self):
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        response = await self.async_client.get(reverse('user_list'))
+        self.assertContains(response, 'Male')
+        response = await self.async_client.get(reverse('gender_list'))
+        self.assertContains(response, 'Male')
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncLoginTests(TransactionTestCase):
+    # Password checks run on the auth pool's own connection, so the user has
+    # to be committed.
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('alice', 'alice@example.com', 'secret')
+
+    async def test_login(self):
+        response = await self.async_client.post(reverse('login'), {'form_type': 'login', 'username': 'alice', 'password': 'secret'})
+        self.assertRedirects(response, reverse('user_list'), fetch_redirect_response=False)
+        self.assertEqual((await self.async_client.get(reverse('gender_list'))).status_code, 200)
+        response = await self.async_client.post(reverse('login'), {'form_type': 'login', 'username': 'alice', 'password': 'wrong'})
+        self.assertEqual(response['Location'], reverse('login') + '?error=1')
+
+    @override_settings(CRUD_THROTTLE_RATES={'login': {'username': (1, 60)}})
+    async def test_throttled_login(self):
+        data = {'form_type': 'login', 'username': 'alice', 'password': 'wrong'}
+        self.assertEqual((await self.async_client.post(reverse('login'), data)).status_code, 302)
+        with mock.patch('crud.async_views.check_credentials') as check:
+            response = await self.async_client.post(reverse('login'), data)
+        self.assertEqual(response.status_code, 429)
+        check.assert_not_called()
+
+
+class GenderRegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.male = Gender.objects.create(name='Male')
+        self.female = Gender.objects.create(name='Female')
+        gender_registry.all()
+
+    def assertNoGenderQueries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            response = func()
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in context.captured_queries if '"crud_gender"' in q['sql']])
+        return response
+
+    def test_forms_render_without_gender_queries(self):
+        response = self.assertNoGenderQueries(lambda: self.client.get(reverse('user_add')))
+        self.assertContains(response, '<option value="%s">Female</option>' % self.female.pk, html=True)
+        self.admin.profile.gender = self.male
+        self.admin.profile.save()
+        gender_registry.all()
+        response = self.assertNoGenderQueries(lambda: self.client.get(reverse('user_edit', args=[self.admin.pk])))
+        self.assertContains(response, '<option value="%s" selected>Male</option>' % self.male.pk, html=True)
+
+    def test_list_pages_without_gender_queries(self):
+        self.assertNoGenderQueries(lambda: self.client.get(reverse('gender_list')))
+        self.assertNoGenderQueries(lambda: self.client.get(reverse('user_list'), HTTP_X_REQUESTED_WITH='XMLHttpRequest'))
+
+    def test_form_validates_against_registry(self):
+        form = GenderChoiceField(required=False)
+        self.assertEqual(form.clean(str(self.female.pk)), self.female)
+        self.assertIsNone(form.clean(''))
+        with self.assertRaises(ValidationError):
+            form.clean('999')
+
+    def test_gender_writes_invalidate(self):
+        self.client.post(reverse('gender_add'), {'name': 'Others'})
+        self.assertEqual([g.name for g in gender_registry.all()], ['Male', 'Female', 'Others'])
+        self.client.post(reverse('gender_delete', args=[self.male.pk]))
+        self.assertEqual([g.name for g in gender_registry.all()], ['Female', 'Others'])
+        call_command('run_gender_jobs', stdout=StringIO())
+        self.assertIsNone(gender_registry.get(self.male.pk))
+
+
+class OutboxTests(TestCase):
+    def test_drains_in_batches_over_one_connection(self):
+        for i in range(5):
+            enqueue_mail(f'Subject {i}', 'Body', 'noreply@example.com', [f'user{i}@example.com'])
+        call_command('send_outbox', batch_size=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 5)
+        self.assertEqual(mail.outbox[0].to, ['user0@example.com'])
+
+    def test_failed_send_is_retried_with_backoff(self):
+        email = enqueue_mail('Subject', 'Body', 'noreply@example.com', ['user@example.com'])
+        with mock.patch.object(EmailMessage, 'send', side_effect=SMTPException('down')):
+            self.assertEqual(deliver_batch(max_attempts=2), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), (OutboxEmail.PENDING, 1, 'down'))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        # Not due yet, nothing is picked up.
+        self.assertEqual(deliver_batch(), (0, 0))
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now())
+        with mock.patch.object(EmailMessage, 'send', side_effect=SMTPException('down')):
+            deliver_batch(max_attempts=2)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.FAILED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_unreachable_server_backs_off_the_batch(self):
+        emails = [enqueue_mail(f'Subject {i}', 'Body', 'noreply@example.com', ['user@example.com']) for i in range(3)]
+        connection = mock.Mock()
+        connection.open.side_effect = SMTPException('connection refused')
+        self.assertEqual(deliver_batch(connection=connection), (0, 3))
+        for email in emails:
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.last_error), (OutboxEmail.PENDING, 1, 'connection refused'))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+        # send_outbox --loop keeps running instead of crashing.
+        self.assertEqual(deliver_batch(connection=connection), (0, 0))
+
+
+    def test_claimed_messages_are_skipped_by_another_worker(self):
+        for i in range(3):
+            enqueue_mail(f'Subject {i}', 'Body', 'noreply@example.com', ['user@example.com'])
+        now = timezone.now()
+        claimed = claim_batch(2, now)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual([email.subject for email in claim_batch(10, now)], ['Subject 2'])
+        self.assertEqual(claim_batch(10, now), [])
+        # A worker that died mid-batch loses its claim once the lease runs out.
+        self.assertEqual(len(claim_batch(10, now + outbox.CLAIM_LEASE)), 3)
+
+    def test_worker_sending_leaves_nothing_for_another(self):
+        enqueue_mail('Subject', 'Body', 'noreply@example.com', ['user@example.com'])
+        results = []
+
+        def send_and_race(*args, **kwargs):
+            results.append(deliver_batch())
+            return 1
+
+        with mock.patch.object(EmailMessage, 'send', side_effect=send_and_race):
+            self.assertEqual(deliver_batch(), (1, 0))
+        self.assertEqual(results, [(0, 0)])
+
+
+class ImportUsersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        Gender.objects.create(name='Female')
+
+    def run_import(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as handle:
+            handle.write(content)
+        stdout, stderr = StringIO(), StringIO()
+        options.setdefault('workers', 1)
+        call_command('import_users', handle.name, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv_import_with_rejects(self):
+        User.objects.create(username='taken')
+        content = (
+            'username,first_name,last_name,email,gender,address,date_of_birth,phone_number,password\n'
+            'ann,Ann,Lee,ann@example.com,female,1 Main St,1990-02-03,912345,pw-ann\n'
+            'bob,Bob,Ray,,,,,,\n'
+            'taken,T,K,,,,,,\n'
+            'bad,,,,,,,,\n'
+            'cy,Cy,Do,,Robot,,,,\n'
+            'ann,Ann,Again,,,,,,\n'
+        )
+        # Gender registry, username check, then savepoint, the two bulk
+        # INSERTs, the search index batch and the statistics upsert for the
+        # whole chunk.
+        with self.assertNumQueries(8):
+            stdout, stderr = self.run_import(content, '.csv', chunk_size=100)
+        self.assertIn('Created 2 user(s), rejected 4 row(s).', stdout)
+        self.assertIn('line 4 (taken): Username already exists.', stderr)
+        ann = User.objects.get(username='ann')
+        self.assertTrue(ann.check_password('pw-ann'))
+        self.assertEqual(ann.profile.gender.name, 'Female')
+        self.assertEqual(str(ann.profile.date_of_birth), '1990-02-03')
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+        self.assertEqual([user.username for user in search.search_users(User.objects.all(), 'lee')], ['ann'])
+
+    def test_passwords_hashed_in_worker_processes(self):
+        rows = ''.join(f'user{i},First,Last{i},,,,,,pw-{i}\n' for i in range(6))
+        with mock.patch.object(import_users, 'ProcessPoolExecutor', wraps=import_users.ProcessPoolExecutor) as pool:
+            stdout, stderr = self.run_import('username,first_name,last_name,email,gender,address,date_of_birth,phone_number,password\n' + rows, '.csv', chunk_size=4, workers=2)
+        pool.assert_called_once_with(2)
+        self.assertIn('Created 6 user(s), rejected 0 row(s).', stdout)
+        for i in range(6):
+            self.assertTrue(User.objects.get(username=f'user{i}').check_password(f'pw-{i}'))
+
+    def test_ndjson_dry_run(self):
+        content = '{"username": "dee", "first_name": "Dee", "last_name": "Ng"}\nnot json\n'
+        stdout, stderr = self.run_import(content, '.ndjson', dry_run=True)
+        self.assertIn('Validated 1 user(s), rejected 1 row(s).', stdout)
+        self.assertFalse(User.objects.filter(username='dee').exists())
+
+    def test_dry_run_rejects_duplicates_across_chunks(self):
+        content = 'username,first_name,last_name\nann,Ann,Lee\nbob,Bob,Ray\nann,Ann,Again\n'
+        stdout, stderr = self.run_import(content, '.csv', chunk_size=2, dry_run=True)
+        self.assertIn('Validated 2 user(s), rejected 1 row(s).', stdout)
+        self.assertIn('line 4 (ann): Duplicate username in file.', stderr)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret', first_name='Ada', last_name='Admin')
+        self.client.force_login(self.admin)
+        female = Gender.objects.create(name='Female')
+        for i in range(5):
+            user = User.objects.create(username=f'user{i}', first_name='Test', last_name=f'User{i}')
+            user.profile.gender = female
+            user.profile.phone_number = i
+            user.profile.save()
+
+    def test_csv_stream(self):
+        response = self.client.get(reverse('user_export'))
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,username,first_name,last_name,email,gender,address,date_of_birth,phone_number')
+        self.assertEqual(len(lines), 7)
+        self.assertTrue(lines[2].endswith(',user0,Test,User0,,Female,,,0'))
+
+    def test_ndjson_stream_with_search(self):
+        response = self.client.get(reverse('user_export'), {'format': 'ndjson', 'search': 'user3'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['username'] for row in rows], ['user3'])
+
+    async def test_asgi_stream_is_async(self):
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        response = await self.async_client.get(reverse('user_export'))
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(content.decode().splitlines()), 7)
+
+    def test_chunks_are_separate_queries(self):
+        gender_registry.all()
+        with self.assertNumQueries(2):
+            rows = list(export_rows(chunk_size=4))
+        self.assertEqual(len(rows), 6)
+
+    def test_command(self):
+        stdout = StringIO()
+        call_command('export_users', format='csv', search='user4', stdout=stdout)
+        self.assertEqual(len(stdout.getvalue().splitlines()), 2)
+
+    def test_requires_superuser(self):
+        self.client.force_login(User.objects.get(username='user0'))
+        self.assertEqual(self.client.get(reverse('user_export')).status_code, 302)
+
+
+class ProfileWriteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.female = Gender.objects.create(name='Female')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret', first_name='Ada', last_name='Admin')
+        gender_registry.all()
+
+    def form_data(self, **overrides):
+        data = {
+            'username': 'ann', 'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com',
+            'gender': self.female.pk, 'address': '1 Main St', 'date_of_birth': '1990-02-03', 'phone_number': '912345',
+        }
+        data.update(overrides)
+        return data
+
+    def writes(self, context):
+        return [
+            ' '.join(query['sql'].split()[:3]).replace('"', '')
+            for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+
+    def test_login(self):
+        with self.assertNumQueries(9), CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('login'), {'form_type': 'login', 'username': 'admin', 'password': 'secret'})
+        # last_login is the only auth_user write and the profile is untouched.
+        self.assertEqual(self.writes(context), ['INSERT INTO django_session', 'UPDATE auth_user SET', 'UPDATE django_session SET'])
+
+    def test_user_add(self):
+        self.client.force_login(self.admin)
+        # Includes the SAVEPOINT and RELEASE of the atomic block around the writes.
+        with self.assertNumQueries(9), CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('user_add'), self.form_data(password='pw', confirm_password='pw'))
+        self.assertEqual(self.writes(context), ['INSERT INTO auth_user', 'INSERT INTO crud_profile', 'INSERT INTO crud_directorystat'])
+        profile = Profile.objects.get(user__username='ann')
+        self.assertEqual((profile.gender, profile.address, profile.phone_number), (self.female, '1 Main St', 912345))
+
+    def test_user_edit(self):
+        self.client.force_login(self.admin)
+        user = User.objects.create(username='ann', first_name='Ann', last_name='Lee', email='ann@example.com')
+        with self.assertNumQueries(8), CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('user_edit', args=[user.pk]), self.form_data(last_name='Roe'))
+        # The gender and birth date moved between statistics buckets.
+        self.assertEqual(self.writes(context), ['UPDATE auth_user SET', 'UPDATE crud_profile SET', 'INSERT INTO crud_directorystat'])
+        self.assertIn('SET "last_name" = \'Roe\' WHERE', context.captured_queries[4]['sql'])
+
+    def test_unchanged_user_edit_writes_nothing(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('user_edit', args=[self.admin.pk]), self.form_data(username='admin', first_name='Ada', last_name='Admin', email='admin@example.com'))
+        with self.assertNumQueries(4), CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('user_edit', args=[self.admin.pk]), self.form_data(username='admin', first_name='Ada', last_name='Admin', email='admin@example.com'))
+        self.assertEqual(self.writes(context), [])
+
+    def test_user_profile_edit(self):
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(6), CaptureQueriesContext(connection) as context:
+            self.client.post(reverse('user_profile_edit'), self.form_data(username='admin', first_name='Ada', last_name='Admin', email='admin@example.com'))
+        self.assertEqual(self.writes(context), ['UPDATE crud_profile SET', 'INSERT INTO crud_directorystat'])
+        self.assertEqual(Profile.objects.get(user=self.admin).address, '1 Main St')
+
+    def test_login_keeps_directory_version(self):
+        version = caching.get_version(caching.DIRECTORY)
+        self.client.login(username='admin', password='secret')
+        self.assertEqual(caching.get_version(caching.DIRECTORY), version)
+
+
+class BulkActionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.female = Gender.objects.create(name='Female')
+        for i in range(7):
+            User.objects.create(username=f'user{i}', first_name='Bulk', last_name=f'User{i}')
+        gender_registry.all()
+
+    def post(self, **data):
+        return self.client.post(reverse('user_bulk_action'), data)
+
+    def test_set_gender_for_selected_ids(self):
+        ids = list(User.objects.filter(username__in=['user1', 'user2']).values_list('id', flat=True))
+        Profile.objects.filter(user_id=ids[0]).delete()
+        response = self.post(action='set_gender', ids=ids, gender=self.female.pk)
+        self.assertEqual(response.json(), {'action': 'set_gender', 'affected': 2})
+        self.assertEqual(Profile.objects.filter(gender=self.female).count(), 2)
+
+    @override_settings(CRUD_SOFT_DELETE_USERS=False)
+    def test_delete_matching_search_in_chunks(self):
+        chunks = list(bulk.id_chunks(bulk.selected_users(search_query='bulk'), chunk_size=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        response = self.post(action='delete', select_all='1', search='bulk')
+        self.assertEqual(response.json()['affected'], 7)
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['admin'])
+        self.assertEqual(search.search_users(User.objects.all(), 'user1').count(), 0)
+
+    def test_delete_statements_per_chunk_are_constant(self):
+        users = bulk.selected_users(search_query='bulk')
+        with CaptureQueriesContext(connection) as small:
+            bulk.delete_users(bulk.id_chunks(users.filter(username='user0')))
+        with CaptureQueriesContext(connection) as large:
+            bulk.delete_users(bulk.id_chunks(users))
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_deactivate_skips_acting_admin(self):
+        response = self.post(action='deactivate', select_all='1', search='')
+        self.assertEqual(response.json()['affected'], 7)
+        self.assertTrue(User.objects.get(pk=self.admin.pk).is_active)
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.post(action='explode', ids=[1]).status_code, 400)
+        self.assertEqual(self.post(action='set_gender', ids=[1], gender='999').status_code, 400)
+        self.assertEqual(self.client.get(reverse('user_bulk_action')).status_code, 405)
+
+
+class BenchmarkQueryCountTests(TestCase):
+    databases = {'default', 'replica'}
+
+    def test_replica_queries_are_counted(self):
+        scenario = suite.Scenario('replica', lambda client, n: HttpResponse(User.objects.using('replica').count()), reads=False)
+        self.assertEqual(suite.run_scenario(scenario, self.client, iterations=1, warmup=0)['queries'], 1)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        gender_registry.clear()
+        seed(users=25, genders=2)
+
+    def test_every_scenario_runs(self):
+        results = suite.run(iterations=1, warmup=0)
+        self.assertEqual(set(results), {scenario.name for scenario in suite.build_scenarios()})
+        for result in results.values():
+            self.assertEqual(result['requests'], 1)
+            self.assertGreater(result['queries'], 0)
+
+    def test_compare_flags_slower_and_chattier_scenarios(self):
+        baseline = {'a': {'p50_ms': 10.0, 'queries': 3}, 'b': {'p50_ms': 10.0, 'queries': 3}, 'c': {'p50_ms': 10.0, 'queries': 3}}
+        current = {'a': {'p50_ms': 11.0, 'queries': 3}, 'b': {'p50_ms': 15.0, 'queries': 3}, 'c': {'p50_ms': 9.0, 'queries': 4}, 'd': {'p50_ms': 1.0, 'queries': 1}}
+        regressed = {row[0] for row in suite.compare(current, baseline, threshold=20) if row[-1]}
+        self.assertEqual(regressed, {'b', 'c'})
+
+    def test_render_benchmark_runs(self):
+        results = render.run(iterations=2, warmup=1)
+        self.assertEqual(list(results), list(render.CONFIGURATIONS))
+        self.assertEqual(set(results['uncached']), {'user_list', 'gender_list', 'user_add', 'user_edit'})
+        self.assertEqual(len(render.savings(results)), 8)
+
+
+@override_settings(CRUD_METRICS_ENABLED=True)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics_registry.clear()
+        gender_registry.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+
+    def test_records_per_view_histograms(self):
+        self.client.get(reverse('user_list'), {'mode': 'cursor'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.client.get(reverse('gender_list'))
+        self.client.get('/no-such-page/')
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE crud_request_duration_seconds histogram', body)
+        self.assertIn('crud_request_duration_seconds_count{view="user_list"} 1', body)
+        self.assertIn('crud_request_duration_seconds_count{view="<unresolved>"} 1', body)
+        # request.user, the keyset page and the gender registry load
+        self.assertIn('crud_request_queries_bucket{view="user_list",le="5"} 1', body)
+        self.assertIn('crud_request_queries_bucket{view="user_list",le="2"} 0', body)
+        self.assertIn('crud_request_db_duration_seconds_count{view="gender_list"} 1', body)
+
+    @override_settings(ROOT_URLCONF=AsyncURLConf)
+    async def test_records_async_requests(self):
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        await self.async_client.get(reverse('user_list'), {'mode': 'cursor'}, headers={'X-Requested-With': 'XMLHttpRequest'})
+        body = await sync_to_async(metrics_registry.render)()
+        self.assertIn('crud_request_duration_seconds_count{view="user_list"} 1', body)
+        self.assertIn('crud_request_queries_bucket{view="user_list",le="1"} 0', body)
+
+    async def test_middleware_is_async_in_an_async_chain(self):
+        async def get_response(request):
+            await User.objects.acount()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        await middleware(RequestFactory().get('/'))
+        self.assertIn('crud_request_queries_bucket{view="<unresolved>",le="1"} 1', metrics_registry.render())
+
+    def test_superuser_only(self):
+        user = User.objects.create_user('plain', 'plain@example.com', 'secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+
+    @override_settings(CRUD_METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(reverse('user_list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertNotIn('view="user_list"', metrics_registry.render())
+
+
+class RequestProfilerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(CRUD_PROFILER_ENABLED=True, CRUD_PROFILE_DIR=directory.name, CRUD_PROFILE_KEEP=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+
+    def test_profiles_view_with_sql(self):
+        response = self.client.get(reverse('user_list'), {'_profile': '1', 'mode': 'cursor', 'search': 'admin'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 200)
+        profile = load_profile(response['X-Profile'])
+        self.assertEqual(profile['view'], 'user_list')
+        self.assertEqual(profile['query_count'], len(profile['queries']))
+        self.assertTrue(any('crud_profile' in query['sql'] for query in profile['queries']))
+        self.assertIn('cumulative', profile['stats'])
+        self.assertContains(self.client.get(reverse('profile_list')), 'user_list')
+        self.assertContains(self.client.get(reverse('profile_detail', args=[response['X-Profile']])), 'crud_profile')
+
+    def test_ring_keeps_newest(self):
+        names = [self.client.get(reverse('gender_list'), {'_profile': '1'})['X-Profile'] for _ in range(3)]
+        self.assertEqual(profile_names(), names[:0:-1])
+
+    def test_only_superusers_and_flagged_requests(self):
+        self.assertNotIn('X-Profile', self.client.get(reverse('gender_list')))
+        self.client.force_login(User.objects.create_user('plain', 'plain@example.com', 'secret'))
+        self.assertNotIn('X-Profile', self.client.get(reverse('user_list'), {'_profile': '1'}))
+        self.assertEqual(profile_names(), [])
+
+    def test_unknown_profile(self):
+        self.assertEqual(self.client.get(reverse('profile_detail', args=['settings.py'])).status_code, 404)
+
+
+class DatabaseProfileTests(TestCase):
+    def pragmas(self, *names):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper(dict(connection.settings_dict, NAME=f'{directory}/tuning.sqlite3'), alias='tuning')
+            try:
+                with wrapper.cursor() as cursor:
+                    values = []
+                    for name in names:
+                        cursor.execute(f'PRAGMA {name}')
+                        values.append(cursor.fetchone()[0])
+                    return values
+            finally:
+                wrapper.close()
+
+    @override_settings(CRUD_DB_PROFILE='production')
+    def test_production_pragmas(self):
+        self.assertEqual(self.pragmas('journal_mode', 'synchronous', 'busy_timeout', 'cache_size'), ['wal', 1, 5000, -64000])
+
+    @override_settings(CRUD_DB_PROFILE='default')
+    def test_default_profile_leaves_sqlite_alone(self):
+        self.assertEqual(self.pragmas('journal_mode', 'synchronous'), ['delete', 2])
+
+
+class ReadReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def read_alias(self, request):
+        @routers.replica_reads
+        def view(request):
+            return router.db_for_read(User)
+        return view(request)
+
+    def test_list_reads_use_replica_until_pinned(self):
+        request = RequestFactory().get('/')
+        with mock.patch('crud.routers.replica_available', return_value=True):
+            self.assertEqual(self.read_alias(request), 'replica')
+            self.assertEqual(router.db_for_read(User), 'default')
+            response = HttpResponse()
+            response.set_signed_cookie(routers.PIN_COOKIE, '1')
+            request.COOKIES[routers.PIN_COOKIE] = response.cookies[routers.PIN_COOKIE].value
+            self.assertEqual(self.read_alias(request), 'default')
+        self.assertEqual(router.db_for_write(User), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'crud'))
+
+    def test_test_mirror_reads_through_primary(self):
+        self.assertEqual(self.read_alias(RequestFactory().get('/')), 'default')
+
+    def test_writes_pin_the_client(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('user_edit', args=[self.admin.pk]))
+        self.assertNotIn(routers.PIN_COOKIE, self.client.cookies)
+        self.client.post(reverse('user_edit', args=[self.admin.pk]), {'username': 'admin', 'first_name': 'A', 'last_name': 'B', 'email': 'admin@example.com', 'phone_number': '1'})
+        self.assertTrue(self.client.cookies[routers.PIN_COOKIE].value)
+        self.client.get(reverse('logout'))
+        self.assertEqual(self.client.cookies[routers.PIN_COOKIE].value, '')
+
+
+class HotQueryPlanTests(TestCase):
+    def test_no_unexpected_full_scans(self):
+        for query in hot_queries():
+            with self.subTest(query.name):
+                self.assertEqual(query.full_scans(), [])
+
+    def test_missing_index_is_reported(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX crud_auth_user_email_idx')
+        query = next(query for query in hot_queries() if query.name == 'user_by_email')
+        self.assertEqual(len(query.full_scans()), 1)
+        with self.assertRaisesMessage(CommandError, 'user_by_email'):
+            call_command('explain_hot_queries', 'user_by_email', '--check', stdout=StringIO())
+
+
+class ChangePasswordTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ann', 'ann@example.com', 'old-secret')
+        self.client.force_login(self.user)
+
+    def submit(self):
+        return self.client.post(reverse('change_password'), {'old_password': 'old-secret', 'new_password': 'new-secret-42', 'confirm_password': 'new-secret-42'})
+
+    def test_session_holds_only_a_token(self):
+        self.assertTemplateUsed(self.submit(), 'change_password_confirm.html')
+        session = dict(self.client.session)
+        self.assertNotIn('change_password_form_data', session)
+        self.assertNotIn('new-secret-42', repr(session))
+        self.assertLess(len(session['change_password_token']), 40)
+        response = self.client.post(reverse('change_password'), {'confirm': ''})
+        self.assertRedirects(response, reverse('change_password_success'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-secret-42'))
+        self.assertNotIn('change_password_token', self.client.session)
+        # update_session_auth_hash kept the user signed in.
+        self.assertEqual(self.client.get(reverse('change_password_success')).status_code, 200)
+
+    def test_expired_change_starts_over(self):
+        self.submit()
+        caching.get_shared_cache().delete('crud:password-change:%s' % self.client.session['change_password_token'])
+        response = self.client.post(reverse('change_password'), {'confirm': ''})
+        self.assertRedirects(response, reverse('change_password'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('old-secret'))
+
+    def test_confirm_on_another_worker(self):
+        self.submit()
+        # Another worker process starts with an empty local cache.
+        cache.clear()
+        response = self.client.post(reverse('change_password'), {'confirm': ''})
+        self.assertRedirects(response, reverse('change_password_success'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-secret-42'))
+
+    def test_logout_ends_the_session_in_every_worker(self):
+        key = 'django.contrib.sessions.cached_db' + self.client.session.session_key
+        self.client.get(reverse('change_password'))
+        self.assertTrue(caching.get_shared_cache().has_key(key))
+        self.assertFalse(cache.has_key(key))
+        self.client.logout()
+        self.assertFalse(caching.get_shared_cache().has_key(key))
+
+    def test_cancel_discards_the_change(self):
+        self.submit()
+        self.client.post(reverse('change_password'), {'cancel': ''})
+        self.assertRedirects(self.client.post(reverse('change_password'), {'confirm': ''}), reverse('change_password'))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('old-secret'))
+
+
+class TemplateCachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['template_fragments'].clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.gender = Gender.objects.create(name='Female')
+        self.client.force_login(self.admin)
+
+    def test_templates_use_the_cached_loader(self):
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertIsInstance(loader, CachedLoader)
+
+    def test_gender_fragments_follow_the_gender_version(self):
+        self.assertContains(self.client.get(reverse('gender_list')), 'Female')
+        key = make_template_fragment_key('gender_rows', [caching.get_version(caching.GENDERS)])
+        self.assertIsNotNone(caches['template_fragments'].get(key))
+
+        self.gender.name = 'Woman'
+        self.gender.save()
+        for url in (reverse('gender_list'), reverse('user_list'), reverse('user_edit', args=[self.admin.pk])):
+            response = self.client.get(url)
+            self.assertContains(response, 'Woman')
+            self.assertNotContains(response, 'Female')
+
+    def test_gender_select_keeps_the_selected_value(self):
+        other = Gender.objects.create(name='Male')
+        Profile.objects.filter(user=self.admin).update(gender=other)
+        self.client.get(reverse('user_add'))
+        response = self.client.get(reverse('user_edit', args=[self.admin.pk]))
+        self.assertContains(response, f'<option value="{other.pk}" selected>Male</option>', html=True)
+
+    def test_gender_select_key_is_the_selected_pk(self):
+        Profile.objects.filter(user=self.admin).update(gender=self.gender)
+        version = caching.get_version(caching.GENDERS)
+        fragments = caches['template_fragments']
+        self.client.get(reverse('user_edit', args=[self.admin.pk]))
+        self.assertIsNotNone(fragments.get(make_template_fragment_key('gender_select', [version, self.gender.pk])))
+        # A bound form re-rendered with errors selects the same option, and a
+        # posted value that matches no option selects none, like an add form.
+        fragments.clear()
+        self.client.post(reverse('user_edit', args=[self.admin.pk]), {'gender': str(self.gender.pk)})
+        self.assertIsNotNone(fragments.get(make_template_fragment_key('gender_select', [version, self.gender.pk])))
+        self.client.post(reverse('user_add'), {'gender': 'no-such-gender'})
+        self.client.post(reverse('user_add'), {'gender': ''})
+        self.assertIsNotNone(fragments.get(make_template_fragment_key('gender_select', [version, ''])))
+        self.assertIsNone(fragments.get(make_template_fragment_key('gender_select', [version, 'no-such-gender'])))
+        self.assertIsNone(fragments.get(make_template_fragment_key('gender_select', [version, None])))
+
+
+@override_settings(CRUD_THROTTLE_RATES={
+    'login': {'ip': (4, 60), 'username': (2, 60)},
+    'forgot_password': {'ip': (5, 60), 'username': (1, 60)},
+})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('ann', 'ann@example.com', 'secret')
+
+    def sign_in(self, password, username='ann', address='10.0.0.1'):
+        return self.client.post(reverse('login'), {'form_type': 'login', 'username': username, 'password': password}, REMOTE_ADDR=address)
+
+    def test_sliding_window_weights_the_previous_window(self):
+        window = throttling.SlidingWindow('test', 'ip', limit=4, period=60)
+        for _ in range(4):
+            window.hit('10.0.0.1', now=6000)
+        self.assertEqual(window.retry_after('10.0.0.1', now=6030), 30)
+        # A quarter into the next window three quarters of the old hits count.
+        self.assertEqual(window.count('10.0.0.1', now=6075), 3)
+        self.assertEqual(window.retry_after('10.0.0.1', now=6075), 0)
+        self.assertEqual(window.count('10.0.0.2', now=6075), 0)
+
+    def test_failures_per_username_rejected_before_hashing(self):
+        self.assertEqual(self.sign_in('wrong').status_code, 302)
+        self.assertEqual(self.sign_in('wrong', address='10.0.0.2').status_code, 302)
+        with mock.patch('crud.views.authenticate') as authenticate, self.assertNumQueries(0):
+            response = self.sign_in('secret', username=' ANN ', address='10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(int(response['Retry-After']), int(response.context['retry_after']))
+        self.assertContains(response, 'Too many attempts', status_code=429)
+        authenticate.assert_not_called()
+        self.assertEqual(self.sign_in('wrong', username='bob', address='10.0.0.3').status_code, 302)
+
+    def test_successful_sign_ins_only_count_per_ip(self):
+        for _ in range(4):
+            self.assertRedirects(self.sign_in('secret'), reverse('user_list'), fetch_redirect_response=False)
+        self.assertEqual(self.sign_in('secret').status_code, 429)
+        self.assertEqual(self.sign_in('secret', address='10.0.0.2').status_code, 302)
+
+    def test_forgot_password_throttled(self):
+        data = {'form_type': 'forgot_password', 'username_or_email': 'ann'}
+        self.assertRedirects(self.client.post(reverse('login'), data), reverse('login'), fetch_redirect_response=False)
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('login'), data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    @override_settings(CRUD_THROTTLE_RATES={})
+    def test_unconfigured_actions_are_not_limited(self):
+        for _ in range(6):
+            self.assertEqual(self.sign_in('wrong').status_code, 302)
+
+
+class PasswordResetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ann = User.objects.create_user('ann', 'Ann@Example.com', 'secret')
+        User.objects.create_user('ann@example.com', 'other@example.com', 'secret')
+
+    def forgot(self, identifier):
+        return self.client.post(reverse('login'), {'form_type': 'forgot_password', 'username_or_email': identifier})
+
+    def test_resolve_user_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_user('ann'), self.ann)
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_user(' ANN@example.COM '), self.ann)
+        with self.assertNumQueries(1):
+            # A username beats another user's email.
+            self.assertEqual(resolve_user('ann@example.com').username, 'ann@example.com')
+        with self.assertNumQueries(1):
+            self.assertIsNone(resolve_user('nobody'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(resolve_user('   '))
+            self.assertIsNone(resolve_user('x' * 255))
+        self.ann.is_active = False
+        self.ann.save()
+        self.assertIsNone(resolve_user('ann'))
+
+    def test_forgot_password_by_email(self):
+        # The lookup, then the outbox insert.
+        with self.assertNumQueries(2):
+            response = self.forgot('ANN@EXAMPLE.COM')
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.recipients, self.ann.email)
+        reset_url = email.body.split('http://testserver', 1)[1].split()[0]
+        self.assertContains(self.client.get(reset_url), 'New Password')
+        response = self.client.post(reset_url, {'new_password': 'fresh-secret', 'confirm_password': 'fresh-secret'})
+        self.assertRedirects(response, reverse('login'))
+        self.ann.refresh_from_db()
+        self.assertTrue(self.ann.check_password('fresh-secret'))
+        # The token is tied to the old password hash.
+        self.assertContains(self.client.get(reset_url), 'invalid')
+
+    def test_unknown_identifier(self):
+        with self.assertNumQueries(1):
+            response = self.forgot('nobody@example.com')
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertFalse(OutboxEmail.objects.exists())
+        self.assertContains(self.client.get(reverse('login')), 'No user found')
+
+    def test_reset_request_page(self):
+        self.assertContains(self.client.get(reverse('password_reset_request')), 'username_or_email')
+        response = self.client.post(reverse('password_reset_request'), {'username_or_email': 'nobody'})
+        self.assertContains(response, 'No user found')
+        response = self.client.post(reverse('password_reset_request'), {'username_or_email': 'ann'})
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+
+class DirectoryStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.female = Gender.objects.create(name='Female')
+        self.male = Gender.objects.create(name='Male')
+        gender_registry.all()
+
+    def counters(self):
+        return dict(((row.kind, row.bucket), row.count) for row in DirectoryStat.objects.exclude(count=0))
+
+    def assertMatchesRebuild(self):
+        incremental = self.counters()
+        stats.rebuild()
+        self.assertEqual(incremental, self.counters())
+
+    def test_counters_follow_every_write_path(self):
+        data = {'username': 'ann', 'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com', 'gender': self.female.pk, 'date_of_birth': '1990-02-03', 'phone_number': '5550100', 'password': 'pw', 'confirm_password': 'pw'}
+        self.client.post(reverse('user_add'), data)
+        ann = User.objects.get(username='ann')
+        self.assertEqual(self.counters()[(stats.GENDER, str(self.female.pk))], 1)
+        self.client.post(reverse('user_edit', args=[ann.pk]), dict(data, gender=self.male.pk, date_of_birth='2001-05-06'))
+        self.assertEqual(self.counters()[(stats.BIRTH_YEAR, '2001')], 1)
+        self.client.post(reverse('user_profile_edit'), {'username': 'admin', 'first_name': 'A', 'last_name': 'B', 'email': 'admin@example.com', 'phone_number': '5550100', 'gender': self.female.pk})
+        self.assertMatchesRebuild()
+
+        for i in range(5):
+            User.objects.create(username=f'user{i}', first_name='Bulk', last_name='User')
+        profile = Profile.objects.get(user__username='user0')
+        Profile(pk=profile.pk, user_id=profile.user_id, gender=self.male).save()
+        self.client.post(reverse('user_bulk_action'), {'action': 'set_gender', 'select_all': '1', 'search': 'bulk', 'gender': self.female.pk})
+        self.assertMatchesRebuild()
+
+        self.client.post(reverse('user_bulk_action'), {'action': 'delete', 'ids': list(User.objects.filter(username__in=['user1', 'user2']).values_list('id', flat=True))})
+        self.client.post(reverse('user_delete', args=[ann.pk]))
+        self.female.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.counters()[(stats.USERS, '')], 4)
+        self.assertEqual(self.counters()[(stats.GENDER, '')], 4)
+
+    def test_failed_chunk_leaves_counters_alone(self):
+        for i in range(2):
+            User.objects.create(username=f'user{i}')
+
+        def fail(sender, instance, **kwargs):
+            if instance.username == 'user1':
+                raise RuntimeError('disk full')
+
+        post_delete.connect(fail, sender=User)
+        self.addCleanup(post_delete.disconnect, fail, sender=User)
+        chunks = [[user.pk] for user in User.objects.filter(username__startswith='user').order_by('id')]
+        with self.assertRaises(RuntimeError):
+            bulk.delete_users(chunks)
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['admin', 'user1'])
+        self.assertMatchesRebuild()
+
+    def test_deferred_counts_dropped_on_error(self):
+        with self.assertRaises(RuntimeError), stats.deferred_counts():
+            stats.apply({(stats.USERS, ''): 5})
+            raise RuntimeError('rolled back')
+        self.assertEqual(self.counters()[(stats.USERS, '')], 1)
+
+    def test_summary_buckets(self):
+        profile = self.admin.profile
+        profile.gender = self.female
+        profile.date_of_birth = datetime.date(1990, 6, 1)
+        profile.save()
+        User.objects.create(username='kid')
+        Profile.objects.filter(user__username='kid').update(date_of_birth=datetime.date(2015, 1, 1))
+        stats.rebuild()
+        summary = stats.summary(today=datetime.date(2026, 1, 1))
+        self.assertEqual(summary['users'], 2)
+        self.assertEqual([(gender['name'], gender['count']) for gender in summary['genders']], [('Female', 1), ('Male', 0), ('Not specified', 1)])
+        ages = {bucket['label']: bucket['count'] for bucket in summary['age_buckets']}
+        self.assertEqual((ages['0-17'], ages['35-44'], ages['Unknown']), (1, 1, 0))
+        self.assertEqual(summary['signups'], [{'month': timezone.localdate().strftime('%Y-%m'), 'count': 2}])
+
+    def test_dashboard_queries_do_not_grow_with_users(self):
+        def queries():
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(reverse('directory_stats_json')).json()['users'], User.objects.count())
+            return len(context) - 1
+
+        few = queries()
+        for i in range(30):
+            User.objects.create(username=f'user{i}')
+        self.assertEqual(queries(), few)
+        self.assertContains(self.client.get(reverse('directory_stats')), '31 users')
+
+    def test_rebuild_command(self):
+        DirectoryStat.objects.all().delete()
+        stdout = StringIO()
+        call_command('rebuild_directory_stats', stdout=stdout)
+        self.assertIn('Counted 1 users', stdout.getvalue())
+        self.assertEqual(self.counters()[(stats.USERS, '')], 1)
+
+
+class GenderReassignmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.female = Gender.objects.create(name='Female')
+        self.male = Gender.objects.create(name='Male')
+        for i in range(7):
+            User.objects.create(username=f'user{i}')
+        Profile.objects.filter(user__username__startswith='user').update(gender=self.male)
+        stats.rebuild()
+        gender_registry.all()
+
+    def counters(self):
+        return dict(((row.kind, row.bucket), row.count) for row in DirectoryStat.objects.exclude(count=0))
+
+    def test_delete_hides_gender_until_the_job_runs(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('gender_delete', args=[self.male.pk]))
+        self.assertRedirects(response, reverse('gender_list'))
+        self.assertFalse([q for q in context.captured_queries if q['sql'].startswith('UPDATE "crud_profile"')])
+        self.assertEqual(Profile.objects.filter(gender=self.male).count(), 7)
+        self.assertEqual(gender_registry.all(), [self.female])
+        with self.assertRaises(ValidationError):
+            GenderChoiceField(required=False).clean(str(self.male.pk))
+        self.assertEqual(self.client.get(reverse('gender_edit', args=[self.male.pk])).status_code, 404)
+        self.assertContains(self.client.get(reverse('gender_list')), '0 / 7 (0%)')
+
+    def test_job_moves_profiles_in_chunks_then_deletes(self):
+        job = gender_jobs.schedule_removal(self.male, self.female)
+        self.assertEqual(gender_jobs.move_chunk(job, chunk_size=3), 3)
+        self.assertEqual(self.client.get(reverse('gender_job_status', args=[job.pk])).json()['percent'], 42)
+        self.assertEqual(Profile.objects.filter(gender=self.female).count(), 3)
+
+        stdout = StringIO()
+        GenderReassignment.objects.filter(pk=job.pk).update(status=GenderReassignment.PENDING)
+        call_command('run_gender_jobs', chunk_size=3, stdout=stdout)
+        self.assertIn('Male: moved 7 profile(s), done.', stdout.getvalue())
+        self.assertFalse(Gender.objects.filter(pk=self.male.pk).exists())
+        self.assertEqual(Profile.objects.filter(gender=self.female).count(), 7)
+        status = self.client.get(reverse('gender_job_status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['processed'], status['percent'], status['target']), ('done', 7, 100, 'Female'))
+
+        incremental = self.counters()
+        stats.rebuild()
+        self.assertEqual(incremental, self.counters())
+        self.assertEqual(incremental[(stats.GENDER, str(self.female.pk))], 7)
+
+    def test_merge_target_is_validated_and_locked(self):
+        response = self.client.post(reverse('gender_delete', args=[self.female.pk]), {'merge_into': self.female.pk})
+        self.assertContains(response, 'Choose an active gender to merge into.')
+        self.client.post(reverse('gender_delete', args=[self.male.pk]), {'merge_into': self.female.pk})
+        self.assertEqual(GenderReassignment.objects.get().target, self.female)
+        # The target cannot go away while profiles are still moving into it.
+        self.client.post(reverse('gender_delete', args=[self.female.pk]))
+        self.assertTrue(Gender.objects.get(pk=self.female.pk).is_active)
+
+    def test_job_of_a_dead_worker_is_reclaimed(self):
+        job = gender_jobs.schedule_removal(self.male, self.female)
+        claimed = gender_jobs.claim_next()
+        gender_jobs.move_chunk(claimed, chunk_size=3)
+        # The worker dies here. Another one leaves the job alone at first.
+        self.assertEqual(gender_jobs.run_pending(), [])
+        GenderReassignment.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - gender_jobs.STALE_AFTER * 2)
+        self.assertEqual([finished.pk for finished in gender_jobs.run_pending()], [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (GenderReassignment.DONE, 7))
+        self.assertFalse(Gender.objects.filter(pk=self.male.pk).exists())
+        self.assertFalse(gender_jobs.is_pending_target(self.female))
+
+    def test_reclaimed_job_without_its_gender_moves_nothing(self):
+        job = gender_jobs.schedule_removal(self.male, self.female)
+        gender_jobs.run_pending()
+        unassigned = set(Profile.objects.filter(gender__isnull=True).values_list('pk', flat=True))
+        self.assertTrue(unassigned)
+        # A worker that died between deleting the gender and finishing the
+        # job, as older code could.
+        GenderReassignment.objects.filter(pk=job.pk).update(status=GenderReassignment.RUNNING, heartbeat_at=timezone.now() - gender_jobs.STALE_AFTER * 2)
+        self.assertEqual([finished.status for finished in gender_jobs.run_pending()], [GenderReassignment.DONE])
+        self.assertEqual(set(Profile.objects.filter(gender__isnull=True).values_list('pk', flat=True)), unassigned)
+        incremental = self.counters()
+        stats.rebuild()
+        self.assertEqual(incremental, self.counters())
+
+        # Without a target too, instead of looping on the unassigned profiles.
+        GenderReassignment.objects.filter(pk=job.pk).update(status=GenderReassignment.RUNNING, target=None, heartbeat_at=timezone.now() - gender_jobs.STALE_AFTER * 2)
+        self.assertEqual(len(gender_jobs.run_pending()), 1)
+
+    def test_job_is_done_with_its_gender_deleted(self):
+        job = gender_jobs.schedule_removal(self.male)
+        with mock.patch.object(gender_jobs, 'finish', side_effect=[RuntimeError('worker killed'), None]):
+            gender_jobs.run_job(gender_jobs.claim_next())
+        # The delete rolled back with the failed finish.
+        self.assertTrue(Gender.objects.filter(pk=self.male.pk).exists())
+        job.refresh_from_db()
+        self.assertEqual(job.gender_id, self.male.pk)
+
+    def test_failed_job_can_be_retried(self):
+        job = gender_jobs.schedule_removal(self.male)
+        with mock.patch.object(stats, 'apply', side_effect=RuntimeError('locked')):
+            gender_jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error, job.processed), (GenderReassignment.FAILED, 'locked', 0))
+        self.assertContains(self.client.get(reverse('gender_list')), 'Failed: locked')
+        call_command('run_gender_jobs', retry_failed=True, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (GenderReassignment.DONE, 7))
+        self.assertEqual(Profile.objects.filter(gender__isnull=True).count(), 8)
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.female = Gender.objects.create(name='Female')
+        self.jane = User.objects.create_user('jane', 'jane@example.com', 'secret', first_name='Jane', last_name='Doe')
+        Profile.objects.filter(user=self.jane).update(gender=self.female, date_of_birth=datetime.date(1990, 1, 1))
+        stats.rebuild()
+        gender_registry.all()
+
+    def listed(self, search=''):
+        return [row['username'] for row in self.client.get(reverse('user_list'), {'search': search, 'mode': 'cursor'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()['users']]
+
+    def assertMatchesRebuild(self):
+        incremental = dict(((row.kind, row.bucket), row.count) for row in DirectoryStat.objects.exclude(count=0))
+        self.assertEqual(incremental, stats.rebuild())
+
+    def test_delete_hides_user_until_restored(self):
+        self.assertEqual(self.listed(), ['admin', 'jane'])
+        self.client.post(reverse('user_delete', args=[self.jane.pk]))
+        self.jane.refresh_from_db()
+        self.assertFalse(self.jane.is_active)
+        self.assertIsNotNone(self.jane.profile.deleted_at)
+        self.assertEqual(self.listed(), ['admin'])
+        self.assertEqual(self.listed('jane'), [])
+        self.assertEqual([row[1] for row in export_rows()], ['admin'])
+        self.assertEqual(self.client.get(reverse('user_edit', args=[self.jane.pk])).status_code, 404)
+        self.assertEqual(stats.summary()['users'], 1)
+        self.assertMatchesRebuild()
+        self.assertFalse(self.client_class().login(username='jane', password='secret'))
+        self.assertContains(self.client.get(reverse('deleted_user_list')), 'jane@example.com')
+
+        response = self.client.post(reverse('user_restore', args=[self.jane.pk]))
+        self.assertRedirects(response, reverse('deleted_user_list'))
+        self.assertEqual(self.listed('jane'), ['jane'])
+        self.assertEqual(stats.summary()['users'], 2)
+        self.assertMatchesRebuild()
+        self.assertTrue(self.client_class().login(username='jane', password='secret'))
+
+    def test_restore_keeps_deactivated_users_inactive(self):
+        bob = User.objects.create_user('bob', 'bob@example.com', 'secret', is_active=False)
+        bulk.soft_delete_users([[self.jane.pk, bob.pk]])
+        self.assertEqual(bulk.restore_users([[self.jane.pk, bob.pk]]), 2)
+        self.assertTrue(User.objects.get(pk=self.jane.pk).is_active)
+        self.assertFalse(User.objects.get(pk=bob.pk).is_active)
+        self.assertEqual(self.listed('bob'), ['bob'])
+
+    def test_delete_statements_do_not_grow_with_dependants(self):
+        for i in range(3):
+            self.client_class().login(username='jane', password='secret')
+        with CaptureQueriesContext(connection) as context:
+            bulk.soft_delete_users([[self.jane.pk]])
+        self.assertFalse([q for q in context.captured_queries if q['sql'].startswith('DELETE')])
+
+    def test_bulk_delete_is_soft(self):
+        response = self.client.post(reverse('user_bulk_action'), {'action': 'delete', 'select_all': '1', 'search': ''})
+        self.assertEqual(response.json()['affected'], 1)
+        self.assertTrue(User.objects.filter(pk=self.jane.pk).exists())
+        self.assertEqual(self.listed(), ['admin'])
+        # Deleted users are not picked up by later bulk actions.
+        self.assertEqual(bulk.set_gender(bulk.id_chunks(bulk.selected_users(user_ids=[self.jane.pk])), None), 0)
+        self.assertMatchesRebuild()
+
+    def test_restore_after_gender_merge(self):
+        male = Gender.objects.create(name='Male')
+        User.objects.create(username='john')
+        Profile.objects.filter(user__username='john').update(gender=self.female)
+        stats.rebuild()
+        self.client.post(reverse('user_delete', args=[self.jane.pk]))
+        gender_jobs.schedule_removal(self.female, male)
+        gender_jobs.run_pending()
+        self.assertMatchesRebuild()
+        self.client.post(reverse('user_restore', args=[self.jane.pk]))
+        self.assertEqual(Profile.objects.get(user=self.jane).gender, male)
+        self.assertMatchesRebuild()
+        self.assertEqual(DirectoryStat.objects.get(kind=stats.GENDER, bucket=str(male.pk)).count, 2)
+        self.assertFalse(DirectoryStat.objects.filter(count__lt=0).exists())
+
+    def test_purge_removes_old_deletions_in_batches(self):
+        for i in range(5):
+            User.objects.create(username=f'user{i}')
+        bulk.soft_delete_users([list(User.objects.filter(username__startswith='user').values_list('id', flat=True)), [self.jane.pk]])
+        Profile.objects.exclude(user=self.jane).filter(deleted_at__isnull=False).update(deleted_at=timezone.now() - datetime.timedelta(days=31))
+        counters = stats.summary()
+
+        with CaptureQueriesContext(connection) as context:
+            call_command('purge_deleted_users', batch_size=2, stdout=StringIO())
+        self.assertEqual(len([q for q in context.captured_queries if q['sql'].startswith('DELETE FROM "auth_user"')]), 3)
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['admin', 'jane'])
+        self.assertEqual(stats.summary(), counters)
+        self.assertMatchesRebuild()
+
+        stdout = StringIO()
+        call_command('purge_deleted_users', days=0, stdout=stdout)
+        self.assertIn('Purged 1 user(s)', stdout.getvalue())
+        self.assertEqual(self.client.post(reverse('user_restore', args=[self.jane.pk])).status_code, 302)
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['admin'])
@@ -0,0 +1,89 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.utils.encoding import force_bytes
+
+from .caching import get_cache
+
+IP = 'ip'
+USERNAME = 'username'
+
+
+def _cache_key(action, scope, ident, window):
+    # Hashed so usernames of any length or charset make valid cache keys.
+    digest = hashlib.md5(force_bytes(ident)).hexdigest()
+    return 'crud:throttle:%s:%s:%s:%d' % (action, scope, digest, window)
+
+
+class SlidingWindow:
+    # Approximate sliding window over two fixed windows: the previous
+    # window's count is weighted by how much of it still overlaps the last
+    # `period` seconds. Two counters per identity, read with one get_many,
+    # and only add/incr, which both the locmem and the file cache provide.
+    def __init__(self, action, scope, limit, period):
+        self.action = action
+        self.scope = scope
+        self.limit = limit
+        self.period = period
+
+    def _position(self, now):
+        window, offset = divmod(now, self.period)
+        return int(window), offset / self.period
+
+    def count(self, ident, now=None):
+        window, elapsed = self._position(time.time() if now is None else now)
+        current_key = _cache_key(self.action, self.scope, ident, window)
+        previous_key = _cache_key(self.action, self.scope, ident, window - 1)
+        counts = get_cache().get_many([current_key, previous_key])
+        return counts.get(previous_key, 0) * (1 - elapsed) + counts.get(current_key, 0)
+
+    def retry_after(self, ident, now=None):
+        # Seconds until the next attempt is allowed, 0 when it is allowed now.
+        now = time.time() if now is None else now
+        if self.count(ident, now) < self.limit:
+            return 0
+        return max(1, math.ceil(self.period - now % self.period))
+
+    def hit(self, ident, now=None):
+        window, _ = self._position(time.time() if now is None else now)
+        key = _cache_key(self.action, self.scope, ident, window)
+        cache = get_cache()
+        cache.add(key, 0, self.period * 2)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Expired between add and incr.
+            cache.set(key, 1, self.period * 2)
+
+
+def windows(action):
+    # {scope: SlidingWindow} from CRUD_THROTTLE_RATES. A scope left out of
+    # the setting is not limited.
+    rates = getattr(settings, 'CRUD_THROTTLE_RATES', {}).get(action, {})
+    return {scope: SlidingWindow(action, scope, limit, period) for scope, (limit, period) in rates.items()}
+
+
+def client_ip(request):
+    # REMOTE_ADDR only. Behind a reverse proxy, have the proxy set it rather
+    # than trusting a client-supplied X-Forwarded-For.
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def identities(request, username):
+    return {IP: client_ip(request), USERNAME: (username or '').strip().lower()}
+
+
+def retry_after(action, request, username):
+    # Checked before any password hashing or database work. Returns the
+    # seconds to wait, or 0 when the attempt may go ahead.
+    idents = identities(request, username)
+    return max([window.retry_after(idents[scope]) for scope, window in windows(action).items() if idents[scope]], default=0)
+
+
+def record(action, request, username, scopes=(IP, USERNAME)):
+    idents = identities(request, username)
+    for scope, window in windows(action).items():
+        if scope in scopes and idents[scope]:
+            window.hit(idents[scope])
@@ -1,34 +1,38 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# The read-heavy hot paths run as coroutines when served over ASGI.
+hot_views = async_views if settings.CRUD_ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('login/', views.user_login, name='login'),
+    path('login/', hot_views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
-    path('user/list/', views.user_list, name='user_list'),
+    path('user/list/', hot_views.user_list, name='user_list'),
     path('user/add/', views.user_add, name='user_add'),
     path('user/edit/<int:user_id>/', views.user_edit, name='user_edit'),
     path('user/delete/<int:user_id>/', views.user_delete, name='user_delete'),
+    path('user/deleted/', views.deleted_user_list, name='deleted_user_list'),
+    path('user/restore/<int:user_id>/', views.user_restore, name='user_restore'),
     path('user/profile/edit/', views.user_profile_edit, name='user_profile_edit'),
+    path('user/export/', views.user_export, name='user_export'),
+    path('user/bulk/', views.user_bulk_action, name='user_bulk_action'),
 
-    path('gender/list/', views.gender_list, name='gender_list'),
+    path('gender/list/', hot_views.gender_list, name='gender_list'),
     path('gender/add/', views.gender_add, name='gender_add'),
     path('gender/edit/<int:gender_id>/', views.gender_edit, name='gender_edit'),
     path('gender/delete/<int:gender_id>/', views.gender_delete, name='gender_delete'),
+    path('gender/jobs/<int:job_id>/', views.gender_job_status, name='gender_job_status'),
 
     path('user/change_password/', views.change_password, name='change_password'),
     path('user/change_password/success/', views.change_password_success, name='change_password_success'),
     path('user/admin_change_password/<int:user_id>/', views.admin_change_password, name='admin_change_password'),
-]
-from django.urls import path  
-from . import views
-
-urlpatterns = [
-    path('login/', views.user_login, name='login'),
-    path('logout/', views.user_logout, name='logout'),
-
-    path('user/list/', views.user_list, name='user_list'),
-    path('user/add/', views.user_add, name='user_add'),
-    path('user/edit/<int:user_id>/', views.user_edit, name='user_edit'),
-    path('user/delete/<int:user_id>/', views.user_delete, name='user_delete'),
+    path('password/reset/', views.password_reset_request, name='password_reset_request'),
+    path('password/reset/<uidb64>/<token>/', views.password_reset_confirm, name='password_reset_confirm'),
 
+    path('stats/', views.directory_stats, name='directory_stats'),
+    path('stats/json/', views.directory_stats_json, name='directory_stats_json'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:name>/', views.profile_detail, name='profile_detail'),
 ]
@@ -1,11 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
+from django.db import transaction
+from django.core.paginator import Paginator
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, StreamingHttpResponse, Http404
 from django.contrib.auth import authenticate, login, logout, get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
-from django.db.models import Q
 from django.contrib.auth.models import User
 from .forms import UserCreateForm, UserUpdateForm, ChangePasswordForm, AdminChangePasswordForm, ResetPasswordForm
+from .directory import cached_directory_json, visible_users
 from django.contrib.auth import update_session_auth_hash
 from django.contrib import messages
 from django.contrib.auth.decorators import user_passes_test
@@ -13,9 +15,22 @@ from django.urls import reverse
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.template.loader import render_to_string
-from django.core.mail import send_mail
 from django.conf import settings
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.contrib.messages import get_messages
+from django.views.decorators.cache import cache_control
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition, require_POST
+from django.views.decorators.vary import vary_on_headers
+from .caching import DIRECTORY, GENDERS, versioned_key
+from .genders import gender_registry
+from .outbox import enqueue_mail
+from .export import async_chunks, export_chunks
+from .metrics import metrics_registry
+from .profiling import load_profile, recent_profiles
+from .passwords import pop_password_change, stash_password_change
+from .routers import PIN_COOKIE, pins_primary, replica_reads
+from . import bulk, gender_jobs, stats, throttling
 
 def user_login(request):
     if request.method == 'POST':
@@ -23,42 +38,90 @@ def user_login(request):
         if form_type == 'login':
             username = request.POST.get('username')
             password = request.POST.get('password')
+            wait = throttling.retry_after('login', request, username)
+            if wait:
+                return too_many_attempts(request, wait)
+            throttling.record('login', request, username, scopes=[throttling.IP])
             user = authenticate(request, username=username, password=password)
             if user is not None:
                 login(request, user)
                 return redirect('user_list')
             else:
+                throttling.record('login', request, username, scopes=[throttling.USERNAME])
                 login_url = reverse('login')
                 redirect_url = f"{login_url}?error=1"
                 return HttpResponseRedirect(redirect_url)
         elif form_type == 'forgot_password':
-            form = ResetPasswordForm(request.POST)
-            if form.is_valid():
-                username = form.cleaned_data['username']
-                try:
-                    user = User.objects.get(username=username)
-                    token_generator = PasswordResetTokenGenerator()
-                    token = token_generator.make_token(user)
-                    uid = urlsafe_base64_encode(force_bytes(user.pk))
-                    reset_url = request.build_absolute_uri(
-                        reverse('password_reset_confirm', kwargs={'uidb64': uid, 'token': token})
-                    )
-                    subject = "Password Reset Requested"
-                    message = render_to_string('login_password_reset_email.html', {
-                        'user': user,
-                        'reset_url': reset_url,
-                    })
-                    send_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email], fail_silently=False)
-                    messages.success(request, "Password reset instructions have been sent to the email address associated with the account.")
-                    return redirect('login')
-                except User.DoesNotExist:
-                    messages.error(request, "No user found with this username.")
-                    return redirect('login')
-            else:
-                messages.error(request, "Invalid input for password reset.")
-                return redirect('login')
+            return forgot_password(request)
     return render(request, 'login.html')
 
+def too_many_attempts(request, retry_after):
+    response = render(request, 'login.html', {'retry_after': retry_after}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+def reset_throttled(request):
+    # Every reset request may send a mail, so all of them count.
+    identifier = request.POST.get('username_or_email')
+    wait = throttling.retry_after('forgot_password', request, identifier)
+    if not wait:
+        throttling.record('forgot_password', request, identifier)
+    return wait
+
+def send_password_reset(request, user):
+    token_generator = PasswordResetTokenGenerator()
+    token = token_generator.make_token(user)
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    reset_url = request.build_absolute_uri(
+        reverse('password_reset_confirm', kwargs={'uidb64': uid, 'token': token})
+    )
+    subject = "Password Reset Requested"
+    message = render_to_string('login_password_reset_email.html', {
+        'user': user,
+        'reset_url': reset_url,
+    })
+    enqueue_mail(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
+    messages.success(request, "Password reset instructions have been sent to the email address associated with the account.")
+
+def forgot_password(request):
+    wait = reset_throttled(request)
+    if wait:
+        return too_many_attempts(request, wait)
+    # The form resolves the user in one query and keeps it as form.user.
+    form = ResetPasswordForm(request.POST)
+    if form.is_valid():
+        send_password_reset(request, form.user)
+    else:
+        messages.error(request, form.errors['username_or_email'][0])
+    return redirect('login')
+
+def password_reset_request(request):
+    if request.method == 'POST':
+        wait = reset_throttled(request)
+        if wait:
+            return too_many_attempts(request, wait)
+        form = ResetPasswordForm(request.POST)
+        if form.is_valid():
+            send_password_reset(request, form.user)
+            return redirect('login')
+    else:
+        form = ResetPasswordForm()
+    return render(request, 'login_password_reset.html', {'form': form})
+
+def password_reset_confirm(request, uidb64, token):
+    try:
+        user = User.objects.get(pk=int(force_str(urlsafe_base64_decode(uidb64))), is_active=True)
+    except (TypeError, ValueError, OverflowError, User.DoesNotExist):
+        user = None
+    validlink = user is not None and PasswordResetTokenGenerator().check_token(user, token)
+    form = AdminChangePasswordForm(request.POST if validlink and request.method == 'POST' else None)
+    if form.is_valid():
+        user.set_password(form.cleaned_data['new_password'])
+        user.save(update_fields=['password'])
+        messages.success(request, "Your password has been reset. You can log in now.")
+        return redirect('login')
+    return render(request, 'login_password_reset_confirm.html', {'validlink': validlink, 'form': form})
+
 def admin_required(view_func):
     decorated_view_func = user_passes_test(lambda u: u.is_superuser)(view_func)
     return decorated_view_func
@@ -66,13 +129,13 @@ def admin_required(view_func):
 @login_required(login_url='login')
 @admin_required
 def admin_change_password(request, user_id):
-    user_to_change = get_object_or_404(User, pk=user_id)
+    user_to_change = get_object_or_404(visible_users(), pk=user_id)
     if request.method == 'POST':
         form = AdminChangePasswordForm(request.POST)
         if form.is_valid():
             new_password = form.cleaned_data.get('new_password')
             user_to_change.set_password(new_password)
-            user_to_change.save()
+            user_to_change.save(update_fields=['password'])
             messages.success(request, f"Password for user {user_to_change.username} has been changed.")
             return redirect('user_list')
     else:
@@ -83,24 +146,21 @@ def admin_change_password(request, user_id):
 def change_password(request):
     if request.method == 'POST':
         if 'confirm' in request.POST:
-            form = ChangePasswordForm(request.session.get('change_password_form_data'))
-            if form.is_valid():
-                new_password = form.cleaned_data.get('new_password')
+            password_hash = pop_password_change(request)
+            if password_hash is not None:
                 user = request.user
-                user.set_password(new_password)
-                user.save()
+                user.password = password_hash
+                user.save(update_fields=['password'])
                 update_session_auth_hash(request, user)  # Important to keep the user logged in
-                if 'change_password_form_data' in request.session:
-                    del request.session['change_password_form_data']
                 messages.success(request, "Password changed successfully.")
                 return redirect('change_password_success')
             else:
-                # Form data invalid, redirect back to change password form
+                # Nothing stashed or it expired, start over
+                messages.error(request, "The password change expired, please enter it again.")
                 return redirect('change_password')
         elif 'cancel' in request.POST:
             # User cancelled password change
-            if 'change_password_form_data' in request.session:
-                del request.session['change_password_form_data']
+            pop_password_change(request)
             return redirect('change_password')
         else:
             # Initial form submission
@@ -111,8 +171,8 @@ def change_password(request):
                 if not user.check_password(old_password):
                     form.add_error('old_password', 'Old password is incorrect.')
                     return render(request, 'change_password.html', {'form': form})
-                # Save form data in session and show confirmation page
-                request.session['change_password_form_data'] = request.POST
+                # Keep only a short-lived token in the session and show confirmation page
+                stash_password_change(request, form.cleaned_data.get('new_password'))
                 return render(request, 'change_password_confirm.html', {'form': form})
             else:
                 return render(request, 'change_password.html', {'form': form})
@@ -126,78 +186,150 @@ def change_password_success(request):
 
 def user_logout(request):
     logout(request)
-    return redirect('login')
+    response = redirect('login')
+    response.delete_cookie(PIN_COOKIE)
+    return response
+
+def messages_pending(request):
+    # A flashed message must still be rendered, so never answer 304 over it.
+    return len(get_messages(request)) > 0
+
+# ETags hang off the shared data versions, so a write made by any process or worker invalidates them.
+def user_list_etag(request):
+    if messages_pending(request):
+        return None
+    xhr = request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    # The XHR body is the same for everyone, the HTML shell embeds the user's permissions.
+    viewer = () if xhr else (request.user.pk, request.user.is_superuser, request.user.is_staff)
+    return versioned_key('user_list_etag', DIRECTORY, xhr, viewer, sorted(request.GET.lists()))
+
+def gender_list_etag(request):
+    if messages_pending(request):
+        return None
+    return versioned_key('gender_list_etag', GENDERS)
 
 @login_required(login_url='login')
+@cache_control(private=True, no_cache=True)
+@vary_on_headers('X-Requested-With')
+@condition(etag_func=user_list_etag)
+@replica_reads
 def user_list(request):
     search_query = request.GET.get('search', '')
-    users = User.objects.all().order_by('id')
-    if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(email__icontains=search_query)
-        )
-    paginator = Paginator(users, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
 
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        users_data = []
-        for user in page_obj:
-            gender_name = ''
-            address = ''
-            date_of_birth = ''
-            if hasattr(user, 'profile'):
-                if user.profile.gender:
-                    gender_name = user.profile.gender.name
-                address = user.profile.address or ''
-                date_of_birth = user.profile.date_of_birth or ''
-            users_data.append({
-                'id': user.id,
-                'username': user.username,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'email': user.email,
-                'gender': gender_name,
-                'address': address,
-                'date_of_birth': date_of_birth,
-            })
-        data = {
-            'users': users_data,
-            'has_previous': page_obj.has_previous(),
-            'has_next': page_obj.has_next(),
-            'previous_page_number': page_obj.previous_page_number() if page_obj.has_previous() else None,
-            'next_page_number': page_obj.next_page_number() if page_obj.has_next() else None,
-            'current_page': page_obj.number,
-            'num_pages': paginator.num_pages,
-        }
-        return JsonResponse(data)
-
-    return render(request, 'user_list.html', {'page_obj': page_obj, 'search_query': search_query})
+        try:
+            content = cached_directory_json(request.GET)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+        return HttpResponse(content, content_type='application/json')
+
+    return render_user_list(request, search_query)
+
+def render_user_list(request, search_query):
+    # The shell runs no directory query, its rows and pagination arrive over XHR.
+    # The bulk form reads the token from the cookie, make sure it is set.
+    get_token(request)
+    return render(request, 'user_list.html', {'search_query': search_query, 'genders': gender_registry.all(), 'csrf_cookie_name': settings.CSRF_COOKIE_NAME})
+
+@login_required(login_url='login')
+@admin_required
+def user_export(request):
+    file_format = 'ndjson' if request.GET.get('format') == 'ndjson' else 'csv'
+    content_type = 'application/x-ndjson' if file_format == 'ndjson' else 'text/csv'
+    chunks = export_chunks(file_format, request.GET.get('search', ''))
+    if isinstance(request, ASGIRequest):
+        chunks = async_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="users.{file_format}"'
+    return response
 
 @login_required(login_url='login')
+@admin_required
+@require_POST
+@pins_primary
+def user_bulk_action(request):
+    action = request.POST.get('action')
+    if action not in bulk.ACTIONS:
+        return JsonResponse({'error': 'Unknown action.'}, status=400)
+    if request.POST.get('select_all'):
+        users = bulk.selected_users(search_query=request.POST.get('search', ''))
+    else:
+        try:
+            user_ids = [int(user_id) for user_id in request.POST.getlist('ids')]
+        except ValueError:
+            return JsonResponse({'error': 'Invalid user id.'}, status=400)
+        users = bulk.selected_users(user_ids=user_ids)
+
+    if action == 'set_gender':
+        # An empty gender clears it, like the single-user form.
+        gender = None
+        if request.POST.get('gender'):
+            gender_id = request.POST['gender']
+            gender = gender_registry.get(int(gender_id)) if gender_id.isdigit() else None
+            if gender is None or not gender.is_active:
+                return JsonResponse({'error': 'Unknown gender.'}, status=400)
+        affected = bulk.set_gender(bulk.id_chunks(users), gender)
+    else:
+        # Never let an admin delete or lock out their own account in bulk.
+        users = users.exclude(pk=request.user.pk)
+        if action == 'delete' and getattr(settings, 'CRUD_SOFT_DELETE_USERS', False):
+            affected = bulk.soft_delete_users(bulk.id_chunks(users))
+        elif action == 'delete':
+            affected = bulk.delete_users(bulk.id_chunks(users))
+        else:
+            affected = bulk.deactivate_users(bulk.id_chunks(users))
+    return JsonResponse({'action': action, 'affected': affected})
+
+@login_required(login_url='login')
+@admin_required
+def metrics(request):
+    if not getattr(settings, 'CRUD_METRICS_ENABLED', False):
+        raise Http404("Metrics are disabled.")
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@login_required(login_url='login')
+@admin_required
+def profile_list(request):
+    return render(request, 'profile_list.html', {'profiles': recent_profiles(), 'enabled': getattr(settings, 'CRUD_PROFILER_ENABLED', False)})
+
+@login_required(login_url='login')
+@admin_required
+def profile_detail(request, name):
+    profile = load_profile(name)
+    if profile is None:
+        raise Http404("No such profile.")
+    return render(request, 'profile_detail.html', {'profile': profile, 'name': name})
+
+@login_required(login_url='login')
+@replica_reads
+def directory_stats(request):
+    return render(request, 'directory_stats.html', {'stats': stats.summary()})
+
+@login_required(login_url='login')
+@replica_reads
+def directory_stats_json(request):
+    return JsonResponse(stats.summary())
+
+@login_required(login_url='login')
+@pins_primary
 def user_add(request):
     if request.method == 'POST':
         form = UserCreateForm(request.POST)
         if form.is_valid():
             user = form.save(commit=False)
             user.set_password(form.cleaned_data['password'])
-            user.save()
-            gender = form.cleaned_data.get('gender')
-            address = form.cleaned_data.get('address')
-            date_of_birth = form.cleaned_data.get('date_of_birth')
-            phone_number = form.cleaned_data.get('phone_number')
-            if gender:
-                user.profile.gender = gender
-            if address:
-                user.profile.address = address
-            if date_of_birth:
-                user.profile.date_of_birth = date_of_birth
-            if phone_number is not None:
-                user.profile.phone_number = phone_number
-            user.profile.save()
+            # Attach the profile before the first save so the post_save
+            # receiver INSERTs it complete instead of a blank row plus UPDATEs.
+            user.profile = Profile(
+                gender=form.cleaned_data.get('gender'),
+                address=form.cleaned_data.get('address') or None,
+                date_of_birth=form.cleaned_data.get('date_of_birth'),
+                phone_number=form.cleaned_data.get('phone_number'),
+            )
+            # One statistics upsert for the user and its profile, committed
+            # together with them.
+            with transaction.atomic(), stats.deferred_counts():
+                user.save()
             messages.success(request, "User added successfully.")
             return redirect('user_list')
     else:
@@ -205,36 +337,41 @@ def user_add(request):
     return render(request, 'user_form.html', {'form': form, 'title': 'Add User'})
 
 @login_required(login_url='login')
+@pins_primary
 def user_edit(request, user_id):
-    user = get_object_or_404(User, pk=user_id)
+    user = get_object_or_404(visible_users().select_related('profile'), pk=user_id)
     if request.method == 'POST':
         form = UserUpdateForm(request.POST, instance=user, user_id=user_id)
         if form.is_valid():
             user = form.save(commit=False)
+            update_fields = [name for name in form.changed_data if name in UserUpdateForm.Meta.fields]
             password = form.cleaned_data.get('password')
             if password:
                 user.set_password(password)
-            user.save()
+                update_fields.append('password')
+            if update_fields:
+                user.save(update_fields=update_fields)
+            profile = user.profile if hasattr(user, 'profile') else Profile(user=user)
             gender = form.cleaned_data.get('gender')
             address = form.cleaned_data.get('address')
             date_of_birth = form.cleaned_data.get('date_of_birth')
             phone_number = form.cleaned_data.get('phone_number')
             if gender:
-                user.profile.gender = gender
+                profile.gender = gender
             else:
-                user.profile.gender = None
-            user.profile.address = address
-            user.profile.date_of_birth = date_of_birth
+                profile.gender = None
+            profile.address = address
+            profile.date_of_birth = date_of_birth
             if phone_number is not None:
-                user.profile.phone_number = phone_number
-            user.profile.save()
+                profile.phone_number = phone_number
+            profile.save_changes()
             messages.success(request, "User updated successfully.")
             return redirect('user_list')
     else:
         initial = {}
         if hasattr(user, 'profile'):
-            if user.profile.gender:
-                initial['gender'] = user.profile.gender
+            if user.profile.gender_id:
+                initial['gender'] = gender_registry.get(user.profile.gender_id)
             initial['address'] = user.profile.address
             initial['date_of_birth'] = user.profile.date_of_birth
             initial['phone_number'] = user.profile.phone_number
@@ -242,23 +379,49 @@ def user_edit(request, user_id):
     return render(request, 'user_form.html', {'form': form, 'title': 'Edit User'})
 
 @login_required(login_url='login')
+@pins_primary
 def user_delete(request, user_id):
-    user = get_object_or_404(User, pk=user_id)
+    user = get_object_or_404(visible_users(), pk=user_id)
     if request.method == 'POST':
-        user.delete()
-        messages.success(request, "User deleted successfully.")
+        if getattr(settings, 'CRUD_SOFT_DELETE_USERS', False):
+            bulk.soft_delete_users([[user.pk]])
+            messages.success(request, "User deleted successfully. It can be restored from Deleted Users until it is purged.")
+        else:
+            user.delete()
+            messages.success(request, "User deleted successfully.")
         return redirect('user_list')
     return render(request, 'user_confirm_delete.html', {'user': user})
 
-from .models import Gender
+@login_required(login_url='login')
+@replica_reads
+def deleted_user_list(request):
+    profiles = Profile.objects.filter(deleted_at__isnull=False).select_related('user').order_by('-deleted_at', '-user_id')
+    page_obj = Paginator(profiles, 10).get_page(request.GET.get('page'))
+    return render(request, 'deleted_user_list.html', {'page_obj': page_obj, 'purge_after': getattr(settings, 'CRUD_PURGE_DELETED_USERS_AFTER', None)})
+
+@login_required(login_url='login')
+@require_POST
+@pins_primary
+def user_restore(request, user_id):
+    if bulk.restore_users([[user_id]]):
+        messages.success(request, "User restored successfully.")
+    else:
+        messages.error(request, "This user is no longer in Deleted Users.")
+    return redirect('deleted_user_list')
+
+from .models import Gender, GenderReassignment, Profile
 from .forms import GenderForm
 
 @login_required(login_url='login')
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=gender_list_etag)
+@replica_reads
 def gender_list(request):
-    genders = Gender.objects.all().order_by('id')
-    return render(request, 'gender_list.html', {'genders': genders})
+    genders = gender_registry.all()
+    return render(request, 'gender_list.html', {'genders': genders, 'jobs': gender_jobs.recent_jobs()})
 
 @login_required(login_url='login')
+@pins_primary
 def gender_add(request):
     if request.method == 'POST':
         form = GenderForm(request.POST)
@@ -271,8 +434,9 @@ def gender_add(request):
     return render(request, 'gender_form.html', {'form': form, 'title': 'Add Gender'})
 
 @login_required(login_url='login')
+@pins_primary
 def gender_edit(request, gender_id):
-    gender = get_object_or_404(Gender, pk=gender_id)
+    gender = get_object_or_404(Gender, pk=gender_id, is_active=True)
     if request.method == 'POST':
         form = GenderForm(request.POST, instance=gender)
         if form.is_valid():
@@ -283,42 +447,78 @@ def gender_edit(request, gender_id):
     return render(request, 'gender_form.html', {'form': form, 'title': 'Edit Gender'})
 
 @login_required(login_url='login')
+@pins_primary
 def gender_delete(request, gender_id):
-    gender = get_object_or_404(Gender, pk=gender_id)
+    gender = get_object_or_404(Gender, pk=gender_id, is_active=True)
+    targets = [other for other in gender_registry.all() if other.pk != gender.pk]
     if request.method == 'POST':
-        gender.delete()
-        messages.success(request, "Gender deleted successfully.")
+        # Profiles move to the merge target, or to no gender, in the
+        # background. The gender disappears from forms straight away.
+        target = None
+        if request.POST.get('merge_into'):
+            target = next((other for other in targets if str(other.pk) == request.POST['merge_into']), None)
+            if target is None:
+                messages.error(request, "Choose an active gender to merge into.")
+                return render(request, 'gender_confirm_delete.html', {'gender': gender, 'targets': targets})
+        if gender_jobs.is_pending_target(gender):
+            messages.error(request, "Other genders are still being merged into this one. Try again once that has finished.")
+            return redirect('gender_list')
+        job = gender_jobs.schedule_removal(gender, target)
+        if target is None:
+            messages.success(request, f"Gender {gender.name} is being deleted. {job.total} profile(s) will be cleared in the background.")
+        else:
+            messages.success(request, f"Gender {gender.name} is being merged into {target.name}. {job.total} profile(s) will be moved in the background.")
         return redirect('gender_list')
-    return render(request, 'gender_confirm_delete.html', {'gender': gender})
+    return render(request, 'gender_confirm_delete.html', {'gender': gender, 'targets': targets})
+
+@login_required(login_url='login')
+def gender_job_status(request, job_id):
+    job = get_object_or_404(GenderReassignment, pk=job_id)
+    target = gender_registry.get(job.target_id) if job.target_id else None
+    return JsonResponse({
+        'id': job.pk,
+        'gender': job.gender_name,
+        'target': target.name if target else None,
+        'status': job.status,
+        'total': job.total,
+        'processed': job.processed,
+        'percent': job.percent,
+        'error': job.last_error,
+    })
 
 @login_required(login_url='login')
+@pins_primary
 def user_profile_edit(request):
     user = request.user
     if request.method == 'POST':
         form = UserUpdateForm(request.POST, instance=user, user_id=user.id)
         if form.is_valid():
             user = form.save(commit=False)
+            update_fields = [name for name in form.changed_data if name in UserUpdateForm.Meta.fields]
             password = form.cleaned_data.get('password')
             if password:
                 user.set_password(password)
-            user.save()
+                update_fields.append('password')
+            if update_fields:
+                user.save(update_fields=update_fields)
+            profile = user.profile if hasattr(user, 'profile') else Profile(user=user)
             gender = form.cleaned_data.get('gender')
             address = form.cleaned_data.get('address')
             date_of_birth = form.cleaned_data.get('date_of_birth')
             if gender:
-                user.profile.gender = gender
+                profile.gender = gender
             else:
-                user.profile.gender = None
-            user.profile.address = address
-            user.profile.date_of_birth = date_of_birth
-            user.profile.save()
+                profile.gender = None
+            profile.address = address
+            profile.date_of_birth = date_of_birth
+            profile.save_changes()
             messages.success(request, "Profile updated successfully.")
             return redirect('user_list')
     else:
         initial = {}
         if hasattr(user, 'profile'):
-            if user.profile.gender:
-                initial['gender'] = user.profile.gender
+            if user.profile.gender_id:
+                initial['gender'] = gender_registry.get(user.profile.gender_id)
             initial['address'] = user.profile.address
             initial['date_of_birth'] = user.profile.date_of_birth
         form = UserUpdateForm(instance=user, user_id=user.id, initial=initial)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'crud.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'crud.middleware.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'pinuelasite.urls'
@@ -56,13 +59,21 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'crud.context_processors.data_versions',
+            ],
+            # Compile each template once per process. runserver's autoreloader
+            # still resets the cache when a template file changes.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -78,8 +89,111 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # The same file opened read-only. crud.routers sends the reads of the
+    # list views here, so they never share a connection with a writer.
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': (BASE_DIR / 'db.sqlite3').as_uri() + '?mode=ro',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['crud.routers.ReadReplicaRouter']
+
+# SQLite tuning, picked with the CRUD_DB_PROFILE environment variable. PRAGMAS
+# are applied to every new SQLite connection by crud.database, the other keys
+# are merged into every DATABASES entry. "production" switches to WAL so
+# readers no longer wait on writers, and keeps connections open between
+# requests.
+CRUD_DB_PROFILES = {
+    'default': {},
+    'production': {
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'PRAGMAS': {
+            'journal_mode': 'wal',
+            'synchronous': 'normal',
+            'cache_size': -64000,
+            'mmap_size': 256 * 1024 * 1024,
+            'busy_timeout': 5000,
+            'temp_store': 'memory',
+        },
+    },
 }
+CRUD_DB_PROFILE = os.environ.get('CRUD_DB_PROFILE', 'default')
+for database in DATABASES.values():
+    database.update({key: value for key, value in CRUD_DB_PROFILES[CRUD_DB_PROFILE].items() if key != 'PRAGMAS'})
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+    },
+    # {% cache %} fragments. Their keys carry the data versions they depend
+    # on, so a per-process cache never serves stale markup.
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template_fragments',
+    },
+}
+
+# Cache alias holding cached directory pages and counts. Their keys carry
+# the data versions, so a per-process cache never serves stale entries.
+# Switch to 'shared' to also share the entries themselves between workers.
+CRUD_CACHE_ALIAS = 'default'
+
+# Cache alias for state that has to be the same in every process whatever
+# CRUD_CACHE_ALIAS is: the data versions, which management commands bump
+# too, sessions, so one deleted at logout is gone everywhere, and pending
+# password changes, which may be confirmed on a different worker than the
+# one that stashed them.
+CRUD_SHARED_CACHE_ALIAS = 'shared'
+
+# Attempts allowed per (limit, seconds) sliding window, keyed by client IP
+# and by the submitted username, counted in CRUD_CACHE_ALIAS. Login counts
+# every attempt per IP but only failed ones per username, so a user's own
+# successful sign-ins never use up the allowance. Over-limit attempts get a
+# 429 before any password hashing or database work.
+CRUD_THROTTLE_RATES = {
+    'login': {'ip': (20, 60), 'username': (5, 300)},
+    'forgot_password': {'ip': (5, 3600), 'username': (3, 3600)},
+}
+
+# user_delete and the bulk delete action only flag users deleted and
+# inactive, which hides them at once. They can be restored from
+# /user/deleted/ until purge_deleted_users hard-deletes them, once they have
+# been deleted for CRUD_PURGE_DELETED_USERS_AFTER days.
+CRUD_SOFT_DELETE_USERS = True
+CRUD_PURGE_DELETED_USERS_AFTER = 30
+
+# Sessions are read from the cache and written through to django_session, so
+# an authenticated request only queries the database for them on a miss.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = CRUD_SHARED_CACHE_ALIAS
+
+# Serve login, user_list and gender_list with the async views. asgi.py turns
+# this on, WSGI workers keep the sync views.
+CRUD_ASYNC_VIEWS = os.environ.get('CRUD_ASYNC_VIEWS') == '1'
+
+# Threads the async login view uses for password checks.
+CRUD_AUTH_THREADS = 4
+
+# Per-view request histograms, served to superusers at /metrics/.
+CRUD_METRICS_ENABLED = os.environ.get('CRUD_METRICS_ENABLED') == '1'
+
+# Lets superusers add ?_profile=1 to a crud view. The newest
+# CRUD_PROFILE_KEEP reports are kept in CRUD_PROFILE_DIR, listed at /profiles/.
+CRUD_PROFILER_ENABLED = os.environ.get('CRUD_PROFILER_ENABLED') == '1'
+CRUD_PROFILE_DIR = BASE_DIR / 'profiles'
+CRUD_PROFILE_KEEP = 50
 
 
 # Password validation